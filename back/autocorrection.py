@@ -1,113 +1,187 @@
 import numpy as np
 import numpy.typing as npt
 import typing as tp
+from dataclasses import dataclass
 
 from .colorspace import *
+from .histograms import get_histograms
+from .tasks import report_progress
 from .utils import convert_gamma
 
 
-def get_histograms(image: npt.NDArray[int]) -> tp.Tuple[npt.NDArray[int], ...]:
-    print(image.shape)
-    layers = [image[:, :, i] for i in range(image.shape[-1])]
-    layer_bins = [np.bincount(np.ravel(layer), minlength=256) for layer in layers]
-    return tuple(layer_bins)
+def get_noise_percentile(histogram: npt.NDArray[int], noise: float) -> tp.Tuple[int, int]:
+    # The first bins from either end whose cumulative count reaches the noise share
+    noise_count = int(np.sum(histogram) * noise)
+    low = np.searchsorted(np.cumsum(histogram), noise_count)
+    high = len(histogram) - 1 - np.searchsorted(np.cumsum(histogram[::-1]), noise_count)
+    return int(low), int(high)
 
 
-def get_noise_percentile(histogram: npt.NDArray[int], noise: float) -> tp.Tuple[int, int]:
-    total_count = np.sum(histogram)
-    noise_count = int(total_count * noise)
-    low = 0
-    low_count = 0
-    while low_count + histogram[low] < noise_count:
-        low_count += histogram[low]
-        low += 1
+@dataclass(frozen=True)
+class Stretch:
+    # Where autocorrection measures and stretches the levels in a colorspace:
+    # forward maps the stored image there, backward maps the result back
+    forward: tp.Callable[[npt.NDArray], npt.NDArray]
+    backward: tp.Callable[[npt.NDArray], npt.NDArray]
+    channels: slice
+
+
+def _identity(image: npt.NDArray) -> npt.NDArray:
+    return image
 
-    high = 255
-    high_count = 0
-    while high_count + histogram[high] < noise_count:
-        high_count += histogram[high]
-        high -= 1
 
-    return low, high
+def get_stretch(colorspace: ColorSpace, store_gamma: float, display_gamma: float) -> Stretch:
+    if colorspace.name() in [RGBSpace().name(), CMYSpace().name()]:
+        # all channels, in displayed RGB
+        return Stretch(
+            forward=lambda image: convert_gamma(colorspace.to_rgb(image), store_gamma, display_gamma),
+            backward=lambda image: colorspace.from_rgb(convert_gamma(image, display_gamma, store_gamma)),
+            channels=slice(None)
+        )
+    elif colorspace.name() in [HSLSpace().name(), HSVSpace().name()]:
+        # lightness / value only
+        return Stretch(_identity, _identity, slice(-1, None))
+    elif colorspace.name() in [YCoCgSpace().name(), YCbCr601Space().name(), YCbCr709Space().name()]:
+        # luma only
+        return Stretch(_identity, _identity, slice(0, 1))
+    else:
+        raise NotImplementedError(f"Unknown colorspace {colorspace.name()}")
+
+
+def find_levels(histograms: tp.Sequence[npt.NDArray], noise: float) -> tp.Optional[tp.Tuple[float, float]]:
+    # One common [low, high] range of all the channels, found after dropping the `noise`
+    # share of the darkest and brightest samples of every channel; None if there is nothing to stretch
+    percentiles = [get_noise_percentile(histogram=histogram, noise=noise) for histogram in histograms]
+    low = min(low for low, _ in percentiles)
+    high = max(high for _, high in percentiles)
+    return (low / 255, high / 255) if low < high else None
+
+
+def apply_levels(
+        image: npt.NDArray[float],
+        levels: tp.Optional[tp.Tuple[float, float]],
+        stretch: Stretch
+) -> npt.NDArray[float]:
+    # image is already mapped by stretch.forward
+    if levels is not None:
+        low, high = levels
+        image = image.copy()
+        image[:, :, stretch.channels] -= low
+        image[:, :, stretch.channels] /= high - low
+    return np.clip(stretch.backward(image), 0, 1)
 
 
-def autocorrect_rgb_like(
+def autocorrect(
         image: npt.NDArray[float],
         noise: float,
         colorspace: ColorSpace,
         store_gamma: float,
         display_gamma: float
 ) -> npt.NDArray[float]:
-    image = colorspace.to_rgb(image)
-    image = convert_gamma(image, store_gamma, display_gamma)
-    histograms = get_histograms(np.floor(image * 255).astype(np.uint8))
-
-    low, high = 255, 0
-    for histogram in histograms:
-        _low, _high = get_noise_percentile(histogram=histogram, noise=noise)
-        if _low < low:
-            low = _low
-        if _high > high:
-            high = _high
-    if low < high:
-        low /= 255
-        high /= 255
-        image = (image - low) / (high - low)
-    image = convert_gamma(image, display_gamma, store_gamma)
-    return np.clip(colorspace.from_rgb(image), 0, 1)
-
-
-def autocorrect_last_i(
-        image: npt.NDArray[float],
-        noise: float
-) -> npt.NDArray[float]:
-    histograms = get_histograms(np.floor(image[:, :, -1:] * 255).astype(np.uint8))
-    low, high = 255, 0
-    for histogram in histograms:
-        _low, _high = get_noise_percentile(histogram=histogram, noise=noise)
-        if _low < low:
-            low = _low
-        if _high > high:
-            high = _high
-    if low < high:
-        low /= 255
-        high /= 255
-        image[:, :, -1] = (image[:, :, -1] - low) / (high - low)
-    return np.clip(image, 0, 1)
-
-
-def autocorrect_first_y(
-        image: npt.NDArray[float],
-        noise: float
-) -> npt.NDArray[float]:
-    histograms = get_histograms(np.floor(image[:, :, :1] * 255).astype(np.uint8))
-    low, high = 255, 0
-    for histogram in histograms:
-        _low, _high = get_noise_percentile(histogram=histogram, noise=noise)
-        if _low < low:
-            low = _low
-        if _high > high:
-            high = _high
-    if low < high:
-        low /= 255
-        high /= 255
-        image[:, :, 0] = (image[:, :, 0] - low) / (high - low)
-    return np.clip(image, 0, 1)
+    stretch = get_stretch(colorspace, store_gamma, display_gamma)
+    image = stretch.forward(image)
+    histograms = get_histograms(np.floor(image[:, :, stretch.channels] * 255).astype(np.uint8))
+    return apply_levels(image, find_levels(histograms, noise), stretch)
 
 
-def autocorrect(
-        image: npt.NDArray[float],
+def autocorrect_samples(
+        samples: npt.NDArray[int],
+        maxval: int,
         noise: float,
         colorspace: ColorSpace,
         store_gamma: float,
         display_gamma: float
 ) -> npt.NDArray[float]:
-
-    if colorspace.name() in [RGBSpace().name(), CMYSpace().name()]:
-        return autocorrect_rgb_like(image, noise, colorspace, store_gamma, display_gamma)
-    elif colorspace.name() in [HSLSpace().name(), HSVSpace().name()]:
-        return autocorrect_last_i(image, noise)
+    # autocorrect() of samples / maxval without any full-image float work. Every step is a
+    # per-channel function of the sample, so it runs once on the maxval + 1 possible values
+    # and the image only goes through the resulting lookup table.
+    stretch = get_stretch(colorspace, store_gamma, display_gamma)
+    ramp = np.repeat((np.arange(maxval + 1) / maxval)[:, None, None], 3, axis=2)
+    forward = stretch.forward(ramp)
+
+    # the 8-bit histograms autocorrect() would build, from the histograms of the samples
+    counts = get_histograms(samples[:, :, stretch.channels], bins=maxval + 1)
+    bins = np.floor(forward[:, 0, stretch.channels] * 255).astype(np.uint8)
+    histograms = [np.bincount(bins[:, i], weights=count, minlength=256) for i, count in enumerate(counts)]
+
+    lut = apply_levels(forward, find_levels(histograms, noise), stretch)[:, 0, :]
+    image = np.empty(samples.shape, dtype=lut.dtype)
+    for channel in range(image.shape[-1]):
+        image[:, :, channel] = np.take(lut[:, channel], samples[:, :, channel])
+    return image
+
+
+def get_luma_stretch(colorspace: ColorSpace) -> Stretch:
+    # The lightness-like channel of a colorspace, RGB and CMY go through YCbCr 601 for it
+    if colorspace.name() in [HSLSpace().name(), HSVSpace().name()]:
+        return Stretch(_identity, _identity, slice(-1, None))
     elif colorspace.name() in [YCoCgSpace().name(), YCbCr601Space().name(), YCbCr709Space().name()]:
-        return autocorrect_first_y(image, noise)
-    else:
-        raise NotImplementedError(f"Unknown colorspace {colorspace.name()}")
+        return Stretch(_identity, _identity, slice(0, 1))
+    ycbcr = YCbCr601Space()
+    return Stretch(
+        forward=lambda image: ycbcr.from_rgb(colorspace.to_rgb(image)),
+        backward=lambda image: colorspace.from_rgb(ycbcr.to_rgb(image)),
+        channels=slice(0, 1)
+    )
+
+
+def _tile_axis(size: int, tiles: int) -> tp.Tuple[npt.NDArray[int], npt.NDArray[int], npt.NDArray[float]]:
+    # For every pixel along one axis: the two nearest tile centres and the weight of the second one
+    position = (np.arange(size) + 0.5) * tiles / size - 0.5
+    first = np.clip(np.floor(position), 0, tiles - 1).astype(np.intp)
+    second = np.minimum(first + 1, tiles - 1)
+    weight = np.clip(position - first, 0, 1)
+    return first, second, weight
+
+
+CLAHE_BINS = 256
+CLAHE_BAND = 256
+
+
+def equalize_adaptive(values: npt.NDArray[float], clip_limit: float = 2.0, tiles: int = 8) -> npt.NDArray[float]:
+    # Contrast limited adaptive histogram equalization of a (height, width) image in [0, 1]
+    height, width = values.shape
+    tiles_y, tiles_x = min(tiles, height), min(tiles, width)
+    bins = np.clip(np.round(values * (CLAHE_BINS - 1)), 0, CLAHE_BINS - 1).astype(np.intp)
+
+    # all tile histograms in one bincount, the image padded by reflection to whole tiles
+    tile_h, tile_w = -(-height // tiles_y), -(-width // tiles_x)
+    padded = np.pad(bins, ((0, tile_h * tiles_y - height), (0, tile_w * tiles_x - width)), mode="reflect")
+    tile_index = (np.arange(tiles_y)[:, None, None, None] * tiles_x + np.arange(tiles_x)[None, None, :, None])
+    keys = padded.reshape((tiles_y, tile_h, tiles_x, tile_w)) + tile_index * CLAHE_BINS
+    histograms = np.bincount(keys.ravel(), minlength=tiles_y * tiles_x * CLAHE_BINS)
+    histograms = histograms.reshape((tiles_y, tiles_x, CLAHE_BINS)).astype(float)
+
+    # clip every histogram and hand the excess out evenly, then the CDFs become the tile mappings
+    limit = max(1.0, clip_limit * tile_h * tile_w / CLAHE_BINS)
+    excess = np.maximum(histograms - limit, 0).sum(axis=2, keepdims=True)
+    histograms = np.minimum(histograms, limit) + excess / CLAHE_BINS
+    luts = np.cumsum(histograms, axis=2) / (tile_h * tile_w)
+    luts = luts.reshape(-1)
+
+    # every pixel blends the mappings of its four nearest tiles bilinearly, in bands of rows
+    y0, y1, wy = _tile_axis(height, tiles_y)
+    x0, x1, wx = _tile_axis(width, tiles_x)
+    result = np.empty((height, width))
+    for top in range(0, height, CLAHE_BAND):
+        report_progress(top, height)
+        rows = slice(top, top + CLAHE_BAND)
+        band = bins[rows]
+        row0, row1 = y0[rows, None] * tiles_x, y1[rows, None] * tiles_x
+        top_row = luts[(row0 + x0) * CLAHE_BINS + band] * (1 - wx) + luts[(row0 + x1) * CLAHE_BINS + band] * wx
+        bottom_row = luts[(row1 + x0) * CLAHE_BINS + band] * (1 - wx) + luts[(row1 + x1) * CLAHE_BINS + band] * wx
+        result[rows] = top_row * (1 - wy[rows, None]) + bottom_row * wy[rows, None]
+    return result
+
+
+def clahe(
+        image: npt.NDArray[float],
+        colorspace: ColorSpace,
+        clip_limit: float = 2.0,
+        tiles: int = 8
+) -> npt.NDArray[float]:
+    stretch = get_luma_stretch(colorspace)
+    image = stretch.forward(image).copy()
+    channel = stretch.channels.start % image.shape[-1]
+    image[:, :, channel] = equalize_adaptive(image[:, :, channel], clip_limit, tiles)
+    return np.clip(stretch.backward(image), 0, 1)
@@ -0,0 +1,164 @@
+import argparse
+import ast
+import glob
+import os
+import sys
+import time
+import typing as tp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from inspect import signature
+
+from . import tracing
+from .colorspace import RGBSpace
+from .memory import MemoryGuard, MemoryRecord
+from .operations import ImageState
+from .pipeline import OPERATIONS, Plan, PipelineError, Step, build_operation, compile_plan, load_pipeline
+from .reading import read_image
+from .saving import ImageSaver, P5Saver, P6Saver, PNGSaver
+
+
+SAVERS: tp.Dict[str, tp.Callable[[int], ImageSaver]] = {
+    "p5": lambda compression: P5Saver(),
+    "p6": lambda compression: P6Saver(),
+    "png": lambda compression: PNGSaver(compression),
+}
+
+
+def parse_value(value: str) -> tp.Any:
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def parse_step(spec: str) -> Step:
+    # OP[:NAME][,key=value...], the short form of a pipeline step, e.g. "filter:GaussianFilter,sigma=2";
+    # operations without a class take positional values instead, e.g. "gamma:2.2" or "autocorrect:0.01"
+    op, _, rest = spec.partition(":")
+    args = [arg for arg in rest.split(",") if arg]
+    positional = [arg for arg in args if "=" not in arg]
+    step: Step = dict(op=op, args={
+        key: parse_value(value) for key, value in (arg.split("=", 1) for arg in args if "=" in arg)
+    })
+    if op in OPERATIONS and OPERATIONS[op][1] is None:
+        names = signature(OPERATIONS[op][0]).parameters
+        step["args"].update(zip(names, map(parse_value, positional)))
+    elif positional:
+        step["name"] = positional[0]
+    return step
+
+
+def output_path(template: str, path: str, index: int, extension: str) -> str:
+    directory, filename = os.path.split(path)
+    stem, _ = os.path.splitext(filename)
+    return template.format(dir=directory or ".", name=filename, stem=stem, index=index, ext=extension)
+
+
+def process_file(
+        path: str,
+        output: str,
+        plan: Plan,
+        saver: ImageSaver,
+        maxval: int,
+        guard: MemoryGuard
+) -> tp.Tuple[float, tp.List[MemoryRecord]]:
+    # Runs in a worker process, returns the time it took and the memory diagnostics, if enabled
+    start = time.perf_counter()
+    try:
+        image, source_maxval = read_image(path)
+        state = plan.run(ImageState(image, RGBSpace(), 0.0, source_maxval), guard)
+        with open(output, "wb") as stream:
+            saver.save(state.image, stream, maxval, state.maxval)
+    finally:
+        # pool workers exit without running atexit handlers, their trace is written after every file
+        tracing.flush()
+    return time.perf_counter() - start, list(guard.records)
+
+
+def expand_inputs(patterns: tp.Iterable[str]) -> tp.List[str]:
+    paths = list()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(matches if matches else [pattern])
+    return paths
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Apply a sequence of operations to many images without the GUI")
+    parser.add_argument("inputs", nargs="+", help="input files or glob patterns")
+    parser.add_argument("-p", "--pipeline", help="JSON pipeline file, see back/pipeline.py")
+    parser.add_argument(
+        "--op", dest="operations", action="append", default=list(), metavar="SPEC",
+        help="operation to apply after the pipeline, in order: colorspace:CLASS[,convert=False], gamma:VALUE, "
+             "filter:CLASS[,arg=value...], scale:CLASS,height=H,width=W[,...], "
+             "dither:CLASS,n_bits=N, autocorrect[:NOISE], clahe[:CLIP_LIMIT[,TILES]]"
+    )
+    parser.add_argument("--show-plan", action="store_true", help="print the compiled plan before running")
+    parser.add_argument(
+        "-o", "--output", default="{dir}/{stem}_out.{ext}",
+        help="output path template with {dir}, {name}, {stem}, {index} and {ext}"
+    )
+    parser.add_argument("-f", "--format", choices=sorted(SAVERS), default="png")
+    parser.add_argument("--maxval", type=int, choices=[2 ** 8 - 1, 2 ** 16 - 1], default=2 ** 8 - 1)
+    parser.add_argument("--compression", type=int, default=6, help="PNG compression level")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument(
+        "--memory-budget", type=float, metavar="MIB",
+        help="memory one operation may allocate per worker, larger ones run in bands of rows or fail"
+    )
+    parser.add_argument(
+        "--memory-diagnostics", action="store_true", help="report the measured peak of every operation"
+    )
+    return parser
+
+
+def main(argv: tp.Optional[tp.Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        operations = load_pipeline(args.pipeline) if args.pipeline else list()
+        for spec in args.operations:
+            try:
+                operations.append(build_operation(parse_step(spec)))
+            except PipelineError as e:
+                raise PipelineError(f"--op {spec}: {e}")
+        saver = SAVERS[args.format](args.compression)
+    except (PipelineError, OSError, AssertionError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    plan = compile_plan(operations)
+    budget = None if args.memory_budget is None else int(args.memory_budget * 2 ** 20)
+    guard = MemoryGuard(budget, args.memory_diagnostics)
+    if args.show_plan:
+        print(plan.describe(), file=sys.stderr)
+
+    paths = expand_inputs(args.inputs)
+    outputs = [output_path(args.output, path, index, args.format) for index, path in enumerate(paths)]
+    seen: tp.Dict[str, str] = dict()
+    for path, output in zip(paths, outputs):
+        key = os.path.normcase(os.path.abspath(output))
+        if key in seen:
+            print(f"error: {seen[key]} and {path} would both be written to {output}, "
+                  f"tell them apart in --output with {{stem}} or {{index}}", file=sys.stderr)
+            return 2
+        seen[key] = path
+    failures, start = 0, time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(process_file, path, output, plan, saver, args.maxval, guard): (path, output)
+            for path, output in zip(paths, outputs)
+        }
+        for future in as_completed(futures):
+            path, output = futures[future]
+            try:
+                elapsed, records = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"FAIL {path}: {type(e).__name__}: {e}", file=sys.stderr)
+            else:
+                print(f"ok   {path} -> {output} ({elapsed:.2f}s)")
+                for record in records:
+                    print(f"     {record.describe()}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths) - failures}/{len(paths)} images in {elapsed:.2f}s", file=sys.stderr)
+    return 1 if failures else 0
@@ -4,6 +4,10 @@ import numpy as np
 import numpy.typing as npt
 import typing as tp
 
+from . import kernels
+from .tasks import report_progress
+from .utils import image_bytes
+
 BAYER_MATRIX = 1/64 * np.array(
     [
         [0, 32, 8, 40, 2, 34, 10, 42],
@@ -27,6 +31,14 @@ class ImageDitherer:
     def _dither(self, image: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
         pass
 
+    def halo(self) -> tp.Optional[int]:
+        # Rows of neighbours a pixel depends on, None when errors spread over the whole image
+        return None
+
+    def estimate_bytes(self, height: int, width: int) -> int:
+        # the clipped copy dithered in place, and the rescaled result
+        return 2 * image_bytes(height, width)
+
     def dither(self, image: npt.NDArray[np.float64], n_bits: int) -> npt.NDArray[np.float64]:
         image = np.clip(image, 0.0, 1.0)
         image *= 2 ** n_bits - 1
@@ -40,6 +52,9 @@ class RandomDitherer(ImageDitherer):
     def name(self) -> str:
         return "Random"
 
+    def halo(self) -> tp.Optional[int]:
+        return 0
+
     def _dither(self, image: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
         height, width, depth = image.shape
         image += np.random.rand(height, width, 1) - .5
@@ -47,34 +62,27 @@ class RandomDitherer(ImageDitherer):
 
 
 class FloydSteinbergDitherer(ImageDitherer):
+    # (rows down, columns right, sixteenths) of the error every pixel hands on
+    TAPS = ((1, 1, 1), (1, 0, 5), (1, -1, 3), (0, 1, 7))
+
     def name(self) -> str:
         return "FloydSteinberg"
 
     def _dither(self, image: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
-        height, width, depth = np.shape(image)
-        for i in range(height):
-            for j in range(width):
-                value = image[i, j, :]
-                rounded = np.round(value)
-                error = value - rounded
-                error /= 16
-                for (_i, _j), s in zip(
-                        ((i+1, j+1), (i+1, j), (i+1, j-1), (i, j+1)),
-                        (1, 5, 3, 7)
-                ):
-                    if 0 <= _i < height and 0 <= _j < width:
-                        image[_i, _j, :] += error * s
-                image[i, j, :] = rounded
-        return image
+        return kernels.get("error_diffusion")(image, self.TAPS, 16)
 
 
 class OrderedDitherer(ImageDitherer):
     def name(self) -> str:
         return "Ordered"
 
+    def halo(self) -> tp.Optional[int]:
+        return 0
+
     def _dither(self, image: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
         height, width, depth = np.shape(image)
         for i in range(0, height, 8):
+            report_progress(i, height)
             for j in range(0, width, 8):
                 block = image[i:i + 8, j:j + 8, :]
                 block, residuals = np.divmod(block, 1)
@@ -87,26 +95,11 @@ class OrderedDitherer(ImageDitherer):
 
 
 class AtkinsonDitherer(ImageDitherer):
+    # (rows down, columns right, eighths) of the error every pixel hands on, 2/8 of it is dropped
+    TAPS = ((0, 1, 1), (0, 2, 1), (1, -1, 1), (1, 0, 1), (1, 1, 1), (2, 0, 1))
+
     def name(self) -> str:
         return "Atkinson"
 
     def _dither(self, image: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
-        height, width, depth = np.shape(image)
-        for i in range(height):
-            for j in range(width):
-                value = image[i, j, :]
-                rounded = np.round(value)
-                error = value - rounded
-                error /= 8
-                for _i, _j in (
-                        (i, j+1),
-                        (i, j+2),
-                        (i+1, j-1),
-                        (i+1, j),
-                        (i+1, j+1),
-                        (i+2, j)
-                ):
-                    if 0 <= _i < height and 0 <= _j < width:
-                        image[_i, _j, :] += error
-                image[i, j, :] = rounded
-        return image
+        return kernels.get("error_diffusion")(image, self.TAPS, 8)
@@ -0,0 +1,77 @@
+import threading
+import typing as tp
+from collections import OrderedDict
+
+from .operations import Operation, ImageState
+from .tracing import traced
+
+
+Operations = tp.Tuple[Operation, ...]
+
+
+class EditStack:
+    def __init__(
+            self,
+            memory_budget: int = 1024 * 2 ** 20,
+            run: tp.Callable[[Operation, ImageState], ImageState] = Operation.run,
+            lock: tp.Optional[threading.RLock] = None
+    ):
+        self.memory_budget = memory_budget
+        # how a step is computed, e.g. MemoryGuard.run to keep replays within the working memory budget
+        self.run = run
+        # guards the checkpoints, steps themselves run without it so compute may be called off the GUI thread
+        self.lock = lock if lock is not None else threading.RLock()
+        self.source: tp.Optional[ImageState] = None
+        self.operations: Operations = tuple()
+        # results of operation prefixes, least recently used first; the source is kept apart
+        self.checkpoints: tp.OrderedDict[Operations, ImageState] = OrderedDict()
+        # bumped by reset, results of a compute that started before are not cached
+        self.generation = 0
+
+    def reset(self, source: ImageState) -> None:
+        with self.lock:
+            self.source = source
+            self.operations = tuple()
+            self.checkpoints.clear()
+            self.generation += 1
+
+    def memory_usage(self) -> int:
+        return sum(state.image.nbytes for state in self.checkpoints.values())
+
+    @traced
+    def cache(self, operations: Operations, state: ImageState) -> None:
+        with self.lock:
+            self.checkpoints[operations] = state
+            self.checkpoints.move_to_end(operations)
+            usage = self.memory_usage()
+            while usage > self.memory_budget and len(self.checkpoints) > 1:
+                _, evicted = self.checkpoints.popitem(last=False)
+                usage -= evicted.image.nbytes
+
+    def replace(self, index: int, operation: Operation) -> tp.Tuple[Operations, ImageState]:
+        with self.lock:
+            operations = self.operations[:index] + (operation,) + self.operations[index + 1:]
+        return operations, self.compute(operations)
+
+    def remove(self, index: int) -> tp.Tuple[Operations, ImageState]:
+        with self.lock:
+            operations = self.operations[:index] + self.operations[index + 1:]
+        return operations, self.compute(operations)
+
+    @traced
+    def compute(self, operations: Operations) -> ImageState:
+        # Resume from the longest cached prefix, only the steps after it are recomputed
+        with self.lock:
+            start, state, generation = 0, self.source, self.generation
+            for end in range(len(operations), 0, -1):
+                checkpoint = self.checkpoints.get(operations[:end])
+                if checkpoint is not None:
+                    self.checkpoints.move_to_end(operations[:end])
+                    start, state = end, checkpoint
+                    break
+        for end in range(start + 1, len(operations) + 1):
+            state = self.run(operations[end - 1], state)
+            with self.lock:
+                if generation == self.generation:
+                    self.cache(operations[:end], state)
+        return state
@@ -4,7 +4,10 @@ import numpy as np
 import numpy.typing as npt
 import typing as tp
 
-from .autocorrection import get_histograms
+from . import kernels
+from .histograms import luma, luma_histogram
+from .tasks import report_progress
+from .utils import image_bytes
 
 
 class Filter:
@@ -16,14 +19,34 @@ class Filter:
     def name() -> str:
         pass
 
+    def halo(self) -> tp.Optional[int]:
+        # Rows of neighbours a pixel depends on, None when it depends on the whole image
+        return None
+
+    def estimate_bytes(self, height: int, width: int) -> int:
+        # Memory apply_to allocates at its peak, the result included
+        return 2 * image_bytes(height, width)
+
+    def scaled(self, ratio: float) -> 'Filter':
+        # The filter with its spatial parameters scaled by ratio, for a preview on a downscaled proxy
+        return self
+
 
 class KernelFilter(Filter):
     def __init__(self, radius: int = 1):
         self.radius = radius
 
+    def halo(self) -> tp.Optional[int]:
+        return self.radius
+
+    def scaled(self, ratio: float) -> 'KernelFilter':
+        return type(self)(max(0, round(self.radius * ratio)))
+
+    def estimate_bytes(self, height: int, width: int) -> int:
+        # the zero padded copy and the result
+        return image_bytes(height + 2 * self.radius, width + 2 * self.radius) + image_bytes(height, width)
+
     def apply_to(self, image: npt.NDArray) -> npt.NDArray:
-        height, width, layers = np.shape(image)
-        kernel = self.get_kernel()
         padded_image = np.pad(
             image,
             (
@@ -32,11 +55,19 @@ class KernelFilter(Filter):
                 (0, 0)
             )
         )
+        return self.apply_padded(padded_image)
 
-        res_image = np.zeros_like(image)
+    def apply_padded(self, padded_image: npt.NDArray) -> npt.NDArray:
+        # The filtered image from one padded by the radius on every side;
+        # subclasses replace this pixel by pixel loop with a kernel from back/kernels.py
+        size = self.radius*2 + 1
+        height, width = padded_image.shape[0] - size + 1, padded_image.shape[1] - size + 1
+        kernel = self.get_kernel()
+        res_image = np.zeros((height, width) + padded_image.shape[2:])
         for x in range(height):
+            report_progress(x, height)
             for y in range(width):
-                window = padded_image[x: x + self.radius*2 + 1, y: y + self.radius*2 + 1]
+                window = padded_image[x: x + size, y: y + size]
                 res_image[x, y] = self.apply_kernel(window, kernel)
         return res_image
 
@@ -60,6 +91,10 @@ class BoxBlurFilter(KernelFilter):
     def apply_kernel(self, window: npt.NDArray, kernel: npt.NDArray):
         return np.mean(kernel * window, axis=(0, 1))
 
+    def apply_padded(self, padded_image: npt.NDArray) -> npt.NDArray:
+        kernel = self.get_kernel()[:, :, 0]
+        return kernels.get("correlate")(padded_image, kernel / kernel.size)
+
     @staticmethod
     def name() -> str:
         return "Box Blur"
@@ -69,6 +104,9 @@ class SobelFilter(KernelFilter):
     def __init__(self):
         super().__init__(1)
 
+    def scaled(self, ratio: float) -> 'SobelFilter':
+        return self
+
     def apply_kernel(self, window: npt.NDArray, kernel: npt.NDArray):
         r, g, b = window[:, :, 0], window[:, :, 1], window[:, :, 2]
         y = 0.2989 * r + 0.5870 * g + 0.1140 * b
@@ -77,6 +115,14 @@ class SobelFilter(KernelFilter):
         g = (gx**2 + gy**2) ** .5
         return np.dstack((g, g, g))
 
+    def apply_padded(self, padded_image: npt.NDArray) -> npt.NDArray:
+        kernel = self.get_kernel().astype(np.float64)
+        y = luma(padded_image)
+        correlate = kernels.get("correlate")
+        gy, gx = correlate(y, kernel), correlate(y, kernel.T)
+        g = np.hypot(gx, gy)[:, :, 0]
+        return np.dstack((g, g, g))
+
     def get_kernel(self) -> npt.NDArray:
         return np.array(
             [
@@ -101,6 +147,9 @@ class ThresholdFilter(Filter):
         self.threshold1 = threshold1
         self.threshold2 = threshold2
 
+    def halo(self) -> tp.Optional[int]:
+        return 0
+
     def apply_to(self, image: npt.NDArray) -> npt.NDArray:
         r, g, b = image[:, :, 0], image[:, :, 1], image[:, :, 2]
         bw_image = 0.2989 * r + 0.5870 * g + 0.1140 * b
@@ -121,9 +170,28 @@ class GaussianFilter(KernelFilter):
         super().__init__(radius)
         self.sigma = sigma
 
+    @staticmethod
+    def pixel_sigma(sigma: float) -> float:
+        # get_kernel spans [-1, 1] over the radius, the deviation in pixels is sigma * radius
+        return sigma * np.ceil(3*sigma)
+
+    def scaled(self, ratio: float) -> 'GaussianFilter':
+        # the sigma whose blur in pixels is ratio times this one's, found by bisection
+        target = ratio * self.pixel_sigma(self.sigma)
+        low, high = 0.1, self.sigma
+        if self.pixel_sigma(low) >= target:
+            return GaussianFilter(low)
+        for _ in range(40):
+            middle = (low + high) / 2
+            low, high = (middle, high) if self.pixel_sigma(middle) < target else (low, middle)
+        return GaussianFilter(max(0.1, round(high, 3)))
+
     def apply_kernel(self, window: npt.NDArray, kernel: npt.NDArray):
         return np.sum(kernel * window, axis=(0, 1))
 
+    def apply_padded(self, padded_image: npt.NDArray) -> npt.NDArray:
+        return kernels.get("correlate")(padded_image, self.get_kernel()[:, :, 0])
+
     def get_kernel(self) -> npt.NDArray:
         kernel_size = 2 * self.radius + 1
         x, y = np.meshgrid(np.linspace(-1, 1, kernel_size),
@@ -146,6 +214,9 @@ class MedianFilter(KernelFilter):
     def apply_kernel(self, window: npt.NDArray, kernel: npt.NDArray):
         return np.median(window, axis=(0, 1))
 
+    def apply_padded(self, padded_image: npt.NDArray) -> npt.NDArray:
+        return kernels.get("median")(padded_image, self.radius*2 + 1)
+
     def get_kernel(self) -> npt.NDArray:
         return np.array([0])
 
@@ -162,6 +233,18 @@ class UnsharpMaskingFilter(Filter):
         self.amount = amount
         self.gaussian_filter = GaussianFilter(sigma=sigma)
 
+    def halo(self) -> tp.Optional[int]:
+        return self.gaussian_filter.halo()
+
+    def scaled(self, ratio: float) -> 'UnsharpMaskingFilter':
+        scaled = UnsharpMaskingFilter(self.amount, self.sigma)
+        scaled.gaussian_filter = self.gaussian_filter.scaled(ratio)
+        scaled.sigma = scaled.gaussian_filter.sigma
+        return scaled
+
+    def estimate_bytes(self, height: int, width: int) -> int:
+        return self.gaussian_filter.estimate_bytes(height, width) + 2 * image_bytes(height, width)
+
     def apply_to(self, image: npt.NDArray) -> npt.NDArray:
         blurred_image = self.gaussian_filter.apply_to(image)
         return image + (image - blurred_image) * self.amount
@@ -174,9 +257,8 @@ class UnsharpMaskingFilter(Filter):
 class OtsuThresholdFilter(Filter):
 
     def apply_to(self, image: npt.NDArray) -> npt.NDArray:
-        r, g, b = image[:, :, 0:1], image[:, :, 1:2], image[:, :, 2:3]
-        bw_image = 0.2989 * r + 0.5870 * g + 0.1140 * b
-        histogram = get_histograms(np.round(bw_image * 255).astype(int))[0]
+        bw_image = luma(image)
+        histogram = luma_histogram(bw_image)
         histogram = histogram / histogram.sum()
         Q = histogram.cumsum()
         bins = np.arange(256)
@@ -0,0 +1,95 @@
+import typing as tp
+
+import numpy as np
+import numpy.typing as npt
+
+from .history import Region
+from .tracing import traced
+from .utils import quantize
+
+
+HISTOGRAM_CHUNK = 8192
+
+
+def get_histograms(image: npt.NDArray[int], bins: int = 256) -> tp.Tuple[npt.NDArray[int], ...]:
+    # One pass for all channels: channel i is shifted into bins [i * bins, (i + 1) * bins) and a single
+    # bincount runs per chunk of pixels, so the shifted copy stays small and in cache
+    channels = image.shape[-1]
+    pixels = image.reshape((-1, channels))
+    offsets = np.arange(channels, dtype=np.intp) * bins
+    counts = np.zeros(channels * bins, dtype=np.intp)
+    shifted = np.empty((min(HISTOGRAM_CHUNK, len(pixels)), channels), dtype=np.intp)
+    for start in range(0, len(pixels), HISTOGRAM_CHUNK):
+        chunk = shifted[:len(pixels) - start]
+        np.add(pixels[start: start + HISTOGRAM_CHUNK], offsets, out=chunk)
+        counts += np.bincount(chunk.ravel(), minlength=channels * bins)
+    return tuple(counts.reshape((channels, bins)))
+
+
+def luma(image: npt.NDArray[float]) -> npt.NDArray[float]:
+    # (height, width, 1) Rec. 601 luma of an RGB image
+    r, g, b = image[:, :, 0:1], image[:, :, 1:2], image[:, :, 2:3]
+    return 0.2989 * r + 0.5870 * g + 0.1140 * b
+
+
+def luma_histogram(luma_image: npt.NDArray[float]) -> npt.NDArray[int]:
+    return get_histograms(np.clip(np.round(luma_image * 255), 0, 255).astype(np.uint8))[0]
+
+
+class Histograms:
+    # The 8-bit channel and luma histograms of an ImageHolder, computed on demand and kept
+    # until the image changes; changes limited to some regions are applied incrementally
+
+    def __init__(self, holder) -> None:
+        self.holder = holder
+        self._version: tp.Optional[int] = None
+        self._channels: tp.Optional[npt.NDArray[int]] = None
+        self._luma: tp.Optional[npt.NDArray[int]] = None
+
+    @traced
+    def channels(self) -> tp.Tuple[npt.NDArray[int], ...]:
+        self._validate()
+        if self._channels is None:
+            self._channels = self._channel_counts(self.holder.data, self.holder.maxval)
+        return tuple(self._channels.copy())
+
+    @traced
+    def luma(self) -> npt.NDArray[int]:
+        self._validate()
+        if self._luma is None:
+            self._luma = self._luma_counts(self.holder.data, self.holder.maxval)
+        return self._luma.copy()
+
+    @traced
+    def update(
+            self,
+            old: npt.NDArray,
+            old_maxval: tp.Optional[int],
+            regions: tp.Sequence[Region],
+            old_version: int
+    ) -> None:
+        # The holder went from `old` to its current data of the same shape by changing only `regions`
+        if self._version != old_version or old_maxval != self.holder.maxval:
+            return
+        new, maxval = self.holder.data, self.holder.maxval
+        for top, left, height, width in regions:
+            old_tile = old[top: top + height, left: left + width]
+            new_tile = new[top: top + height, left: left + width]
+            if self._channels is not None:
+                self._channels += self._channel_counts(new_tile, maxval) - self._channel_counts(old_tile, maxval)
+            if self._luma is not None:
+                self._luma += self._luma_counts(new_tile, maxval) - self._luma_counts(old_tile, maxval)
+        self._version = self.holder.version
+
+    def _validate(self) -> None:
+        if self._version != self.holder.version:
+            self._version = self.holder.version
+            self._channels = self._luma = None
+
+    @staticmethod
+    def _channel_counts(data: npt.NDArray, maxval: tp.Optional[int]) -> npt.NDArray[int]:
+        return np.stack(get_histograms(quantize(data, 255, maxval)))
+
+    @staticmethod
+    def _luma_counts(data: npt.NDArray, maxval: tp.Optional[int]) -> npt.NDArray[int]:
+        return luma_histogram(luma(data if maxval is None else data / maxval))
@@ -0,0 +1,191 @@
+import tempfile
+import typing as tp
+import zlib
+from dataclasses import dataclass, field
+
+import numpy as np
+import numpy.typing as npt
+
+from .colorspace import ColorSpace
+from .tracing import traced
+
+
+Region = tp.Tuple[int, int, int, int]
+
+
+@dataclass
+class ImageMeta:
+    colorspace: ColorSpace
+    store_gamma: float
+    shape: tp.Tuple[int, ...]
+    dtype: np.dtype
+    # the edit stack operations that produced this state
+    operations: tp.Tuple = tuple()
+    # see ImageHolder.maxval
+    maxval: tp.Optional[int] = None
+
+
+class DiskStore:
+    # Append-only spill file for history steps that no longer fit in memory
+    def __init__(self, directory: tp.Optional[str] = None):
+        self.directory = directory
+        self.file: tp.Optional[tp.BinaryIO] = None
+
+    def put(self, blob: bytes) -> tp.Tuple[int, int]:
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix="cg-history-", dir=self.directory)
+        offset = self.file.seek(0, 2)
+        self.file.write(blob)
+        return offset, len(blob)
+
+    def get(self, offset: int, length: int) -> bytes:
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+@dataclass
+class Step:
+    before: ImageMeta
+    after: ImageMeta
+    old_regions: tp.List[Region]
+    new_regions: tp.List[Region]
+    # old tiles followed by new tiles, zlib-compressed; moved to disk when spilled
+    blobs: tp.Optional[tp.List[bytes]] = None
+    spilled: tp.List[tp.Tuple[int, int]] = field(default_factory=list)
+
+    def size(self) -> int:
+        return sum(map(len, self.blobs)) if self.blobs is not None else 0
+
+    def changed_regions(self) -> tp.Optional[tp.List[Region]]:
+        same = self.before.shape == self.after.shape and self.before.dtype == self.after.dtype
+        return self.old_regions if same else None
+
+    def spill(self, store: DiskStore) -> None:
+        self.spilled = [store.put(blob) for blob in self.blobs]
+        self.blobs = None
+
+    def load(self, store: DiskStore) -> tp.List[bytes]:
+        if self.blobs is not None:
+            return self.blobs
+        return [store.get(offset, length) for offset, length in self.spilled]
+
+
+def _tile_regions(height: int, width: int, tile_size: int) -> tp.Iterator[Region]:
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield top, left, min(tile_size, height - top), min(tile_size, width - left)
+
+
+def _crop(image: npt.NDArray, region: Region) -> npt.NDArray:
+    top, left, height, width = region
+    return image[top: top + height, left: left + width]
+
+
+class History:
+    def __init__(
+            self,
+            memory_budget: int = 256 * 2 ** 20,
+            tile_size: int = 256,
+            spill_directory: tp.Optional[str] = None,
+            compression: int = 1
+    ):
+        self.memory_budget = memory_budget
+        self.tile_size = tile_size
+        self.compression = compression
+        self.store = DiskStore(spill_directory)
+        self.undo_steps: tp.List[Step] = list()
+        self.redo_steps: tp.List[Step] = list()
+
+    def memory_usage(self) -> int:
+        return sum(step.size() for step in self.undo_steps + self.redo_steps)
+
+    def clear(self) -> None:
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.store.close()
+
+    @traced
+    def record(
+            self,
+            old: npt.NDArray,
+            before: ImageMeta,
+            new: npt.NDArray,
+            after: ImageMeta
+    ) -> tp.Optional[tp.List[Region]]:
+        # Returns the changed regions, or None when the whole image was replaced
+        regions = None
+        if old.shape == new.shape and old.dtype == new.dtype:
+            regions = [
+                region for region in _tile_regions(*old.shape[:2], self.tile_size)
+                if not np.array_equal(_crop(old, region), _crop(new, region))
+            ]
+            old_regions = new_regions = regions
+        else:
+            old_regions = list(_tile_regions(*old.shape[:2], self.tile_size))
+            new_regions = list(_tile_regions(*new.shape[:2], self.tile_size))
+        blobs = [self._compress(_crop(old, region)) for region in old_regions] + \
+                [self._compress(_crop(new, region)) for region in new_regions]
+        self.undo_steps.append(Step(before, after, old_regions, new_regions, blobs))
+        self.redo_steps.clear()
+        self._enforce_budget()
+        return regions
+
+    # undo() and redo() return the restored image, its meta and the changed regions (None if all of it changed)
+    Restored = tp.Tuple[npt.NDArray, ImageMeta, tp.Optional[tp.List[Region]]]
+
+    @traced
+    def undo(self, current: npt.NDArray) -> tp.Optional[Restored]:
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        blobs = step.load(self.store)
+        image = self._restore(current, step.before, step.old_regions, blobs[:len(step.old_regions)])
+        return image, step.before, step.changed_regions()
+
+    @traced
+    def redo(self, current: npt.NDArray) -> tp.Optional[Restored]:
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        blobs = step.load(self.store)
+        image = self._restore(current, step.after, step.new_regions, blobs[len(step.old_regions):])
+        return image, step.after, step.changed_regions()
+
+    def _compress(self, tile: npt.NDArray) -> bytes:
+        return zlib.compress(np.ascontiguousarray(tile).tobytes(), self.compression)
+
+    @staticmethod
+    def _restore(
+            current: npt.NDArray,
+            meta: ImageMeta,
+            regions: tp.List[Region],
+            blobs: tp.List[bytes]
+    ) -> npt.NDArray:
+        if current.shape == meta.shape and current.dtype == meta.dtype:
+            if not regions:
+                return current
+            image = current.copy()
+        else:
+            image = np.empty(meta.shape, dtype=meta.dtype)
+        for region, blob in zip(regions, blobs):
+            _, _, height, width = region
+            tile = np.frombuffer(zlib.decompress(blob), dtype=meta.dtype)
+            _crop(image, region)[...] = tile.reshape((height, width, -1))
+        return image
+
+    def _enforce_budget(self) -> None:
+        # Spill the steps least likely to be needed first: oldest undo, then farthest redo
+        usage = self.memory_usage()
+        for step in self.undo_steps + self.redo_steps:
+            if usage <= self.memory_budget:
+                break
+            if step.blobs is not None:
+                usage -= step.size()
+                step.spill(self.store)
@@ -0,0 +1,308 @@
+import os
+import time
+import typing as tp
+import warnings
+
+import numpy as np
+import numpy.typing as npt
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .tasks import report_progress
+
+# The per-pixel hot loops of the backend, each with a NumPy reference implementation and
+# optional accelerated ones (back/numba_kernels.py when numba is importable). get() returns
+# the preferred available implementation, accelerated ones first; BACK_KERNELS overrides
+# it, either for all kernels ("numpy") or per kernel ("error_diffusion=numba,median=numpy").
+# benchmarks/kernels.py checks that every implementation matches the reference.
+
+REFERENCE = "numpy"
+ENVIRONMENT_VARIABLE = "BACK_KERNELS"
+# accelerated implementations in order of preference
+ACCELERATED = ("numba",)
+
+Kernel = tp.Callable[..., npt.NDArray]
+# kernel -> implementation name -> function
+_registry: tp.Dict[str, tp.Dict[str, Kernel]] = dict()
+# kernel -> arguments for the self-test, from a seeded generator
+_samples: tp.Dict[str, tp.Callable[[np.random.Generator], tp.Tuple]] = dict()
+_chosen: tp.Dict[str, Kernel] = dict()
+_accelerated_loaded = False
+_warmed_up = False
+
+
+def register(kernel: str, implementation: str) -> tp.Callable[[Kernel], Kernel]:
+    def decorator(function: Kernel) -> Kernel:
+        _registry.setdefault(kernel, dict())[implementation] = function
+        _chosen.pop(kernel, None)
+        return function
+    return decorator
+
+
+def _load_accelerated() -> None:
+    # numba takes about a second to import, it is only loaded once a kernel is needed
+    global _accelerated_loaded
+    if _accelerated_loaded:
+        return
+    _accelerated_loaded = True
+    try:
+        from . import numba_kernels  # noqa: F401
+    except ImportError:
+        pass
+
+
+def implementations(kernel: str) -> tp.List[str]:
+    # Available implementations of a kernel, the preferred one first
+    _load_accelerated()
+    available = _registry[kernel]
+    return [name for name in ACCELERATED if name in available] + [REFERENCE]
+
+
+def _overrides() -> tp.Dict[str, str]:
+    setting = os.environ.get(ENVIRONMENT_VARIABLE, "").strip()
+    if not setting:
+        return dict()
+    if "=" not in setting:
+        return {kernel: setting for kernel in _registry}
+    return dict(item.split("=", 1) for item in setting.split(",") if "=" in item)
+
+
+def choose(kernel: str) -> str:
+    names = implementations(kernel)
+    requested = _overrides().get(kernel)
+    if requested is None:
+        return names[0]
+    if requested not in names:
+        warnings.warn(f"{ENVIRONMENT_VARIABLE}: {kernel} has no {requested} implementation here, using {names[0]}")
+        return names[0]
+    return requested
+
+
+def get(kernel: str) -> Kernel:
+    function = _chosen.get(kernel)
+    if function is None:
+        function = _chosen[kernel] = _registry[kernel][choose(kernel)]
+    return function
+
+
+def reset() -> None:
+    # Forget the choices, e.g. after changing BACK_KERNELS
+    global _warmed_up
+    _chosen.clear()
+    _warmed_up = False
+
+
+def warm_up() -> None:
+    # Runs every chosen kernel once on its small self-test input, so JIT compilation
+    # (and the import of numba) happens now rather than inside the first real call
+    global _warmed_up
+    if _warmed_up:
+        return
+    _warmed_up = True
+    for kernel in sorted(_registry):
+        get(kernel)(*_samples[kernel](np.random.default_rng(0)))
+
+
+# <-- error diffusion -->
+# taps are (rows down, columns right, weight) in the order the error is handed out,
+# every pixel gives error * weight / divisor to each tap and keeps the rounded value
+Taps = tp.Sequence[tp.Tuple[int, int, float]]
+
+
+def wavefront_slope(taps: Taps) -> int:
+    # Pixels with the same j + slope * i neither feed each other nor, with the taps applied in
+    # the order below, change the order in which a pixel receives its errors: they are
+    # processed together and the result is the same as pixel by pixel in raster order
+    ordered = sorted(taps, key=lambda tap: (-tap[0], -tap[1]))
+    for slope in range(1, 64):
+        offsets = [dj + slope * di for di, dj, _ in ordered]
+        if min(offsets) > 0 and all(a >= b for a, b in zip(offsets, offsets[1:])):
+            return slope
+    raise ValueError(f"No wavefront for taps {taps}")
+
+
+@register("error_diffusion", REFERENCE)
+def error_diffusion(image: npt.NDArray[np.float64], taps: Taps, divisor: float) -> npt.NDArray[np.float64]:
+    height, width = image.shape[:2]
+    slope = wavefront_slope(taps)
+    ordered = sorted(taps, key=lambda tap: (-tap[0], -tap[1]))
+    rows = np.arange(height)
+    steps = width + slope * (height - 1)
+    for step in range(steps):
+        report_progress(step, steps)
+        low = max(0, -(-(step - width + 1) // slope))
+        i = rows[low: min(height - 1, step // slope) + 1]
+        j = step - slope * i
+        value = image[i, j]
+        rounded = np.round(value)
+        error = value - rounded
+        error /= divisor
+        for di, dj, weight in ordered:
+            target_i, target_j = i + di, j + dj
+            inside = (target_i < height) & (0 <= target_j) & (target_j < width)
+            image[target_i[inside], target_j[inside]] += error[inside] * weight
+        image[i, j] = rounded
+    return image
+
+
+def _error_diffusion_sample(rng: np.random.Generator) -> tp.Tuple:
+    return rng.random((37, 53, 3)) * 3, ((1, 1, 1), (1, 0, 5), (1, -1, 3), (0, 1, 7)), 16
+
+
+# <-- kernel filters -->
+# padded is the image with the kernel's radius of padding on every side
+
+
+@register("correlate", REFERENCE)
+def correlate(padded: npt.NDArray, kernel: npt.NDArray) -> npt.NDArray:
+    # sum(kernel * window) for every window, one shifted image at a time
+    size = kernel.shape[0]
+    height, width = padded.shape[0] - size + 1, padded.shape[1] - size + 1
+    result = np.zeros((height, width) + padded.shape[2:])
+    for dy in range(size):
+        report_progress(dy, size)
+        for dx in range(size):
+            result += padded[dy: dy + height, dx: dx + width] * kernel[dy, dx]
+    return result
+
+
+def _correlate_sample(rng: np.random.Generator) -> tp.Tuple:
+    return rng.random((41, 29, 3)), rng.random((5, 5))
+
+
+@register("median", REFERENCE)
+def median(padded: npt.NDArray, size: int) -> npt.NDArray:
+    height, width = padded.shape[0] - size + 1, padded.shape[1] - size + 1
+    result = np.empty((height, width) + padded.shape[2:])
+    # np.median copies the windows, the bands keep that copy at about the size of the image
+    rows = max(1, height // (size * size))
+    for top in range(0, height, rows):
+        report_progress(top, height)
+        band = padded[top: top + rows + size - 1]
+        windows = sliding_window_view(band, (size, size), axis=(0, 1))
+        result[top: top + rows] = np.median(windows, axis=(-2, -1))
+    return result
+
+
+def _median_sample(rng: np.random.Generator) -> tp.Tuple:
+    return rng.random((41, 29, 3)), 3
+
+
+# <-- scaling -->
+# Every target column is a weighted sum of taps source columns: indices and weights are
+# (target width, taps), unused taps have weight 0
+
+
+@register("resample", REFERENCE)
+def resample(image: npt.NDArray, indices: npt.NDArray[np.intp], weights: npt.NDArray) -> npt.NDArray:
+    taps = indices.shape[1]
+    result = np.zeros((image.shape[0], indices.shape[0]) + image.shape[2:], dtype=image.dtype)
+    for tap in range(taps):
+        report_progress(tap, taps)
+        result += image[:, indices[:, tap]] * weights[:, tap, None]
+    return result
+
+
+def _resample_sample(rng: np.random.Generator) -> tp.Tuple:
+    indices = rng.integers(0, 30, (45, 4))
+    return rng.random((23, 30, 3)), indices, rng.random((45, 4))
+
+
+# <-- PNG -->
+# kinds are the PNG filter types of a run of rows, filtered their bytes without the type
+# byte, prev the unfiltered row above the first one; out gets the unfiltered rows
+
+
+def paeth_predictor(a: npt.NDArray, b: npt.NDArray, c: npt.NDArray) -> npt.NDArray:
+    # The neighbour (left, above or upper left) closest to a + b - c
+    pa, pb, pc = np.abs(b - c), np.abs(a - c), np.abs(a + b - c - c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+
+@register("unfilter", REFERENCE)
+def unfilter(
+        kinds: npt.NDArray[np.uint8],
+        filtered: npt.NDArray[np.uint8],
+        prev: npt.NDArray[np.uint8],
+        bpp: int,
+        out: npt.NDArray[np.uint8]
+) -> npt.NDArray[np.uint8]:
+    # A pixel depends on its left, upper and upper left neighbours: pixels on the same
+    # anti-diagonal do not depend on each other and are unfiltered together, bpp lanes at once.
+    # Rows are stored skewed, pixel x of row r at column r + x, so a diagonal is a column.
+    rows, stride = filtered.shape
+    width = stride // bpp
+    # row 0 is prev and column 0 of every row is zeros, as PNG defines them
+    skewed = np.zeros((rows + 1, rows + width + 1, bpp), dtype=np.int32)
+    samples = np.zeros_like(skewed)
+    skewed[0, 1: width + 1] = prev.reshape((width, bpp))
+    for r in range(1, rows + 1):
+        samples[r, r + 1: r + width + 1] = filtered[r - 1].reshape((width, bpp))
+    kinds = np.asarray(kinds)
+    present = np.unique(kinds)
+    steps = rows + width + 1
+    for t in range(2, steps):
+        report_progress(t, steps)
+        low, high = max(1, t - width), min(rows, t - 1) + 1
+        a, b, c = skewed[low: high, t - 1], skewed[low - 1: high - 1, t - 1], skewed[low - 1: high - 1, t - 2]
+        prediction = None
+        for kind in present:
+            value = (0, a, b, (a + b) >> 1)[kind] if kind < 4 else paeth_predictor(a, b, c)
+            if len(present) == 1:
+                prediction = value
+            else:
+                prediction = np.where((kinds[low - 1: high - 1] == kind)[:, None], value,
+                                      0 if prediction is None else prediction)
+        skewed[low: high, t] = (samples[low: high, t] + prediction) & 0xFF
+    for r in range(1, rows + 1):
+        out[r - 1] = skewed[r, r + 1: r + width + 1].reshape(stride)
+    return out
+
+
+def _unfilter_sample(rng: np.random.Generator) -> tp.Tuple:
+    rows, stride = 9, 17 * 3
+    return (rng.integers(0, 5, rows, dtype=np.uint8), rng.integers(0, 256, (rows, stride), dtype=np.uint8),
+            rng.integers(0, 256, stride, dtype=np.uint8), 3, np.empty((rows, stride), dtype=np.uint8))
+
+
+_samples.update(
+    unfilter=_unfilter_sample,
+    error_diffusion=_error_diffusion_sample,
+    correlate=_correlate_sample,
+    median=_median_sample,
+    resample=_resample_sample,
+)
+
+
+def _copies(arguments: tp.Tuple) -> tp.List:
+    return [argument.copy() if isinstance(argument, np.ndarray) else argument for argument in arguments]
+
+
+class Check(tp.NamedTuple):
+    kernel: str
+    implementation: str
+    milliseconds: float
+    # largest absolute difference from the reference's result
+    difference: float
+    matches: bool
+
+
+def self_test(seed: int = 0) -> tp.List[Check]:
+    # Runs every available implementation of every kernel on the same inputs and compares
+    # the results with the reference's; the first call of each also compiles JIT kernels
+    checks = list()
+    for kernel in sorted(_registry):
+        arguments = _samples[kernel](np.random.default_rng(seed))
+        reference = _registry[kernel][REFERENCE](*_copies(arguments))
+        for name in implementations(kernel):
+            function = _registry[kernel][name]
+            # kernels may work in place, every call gets its own copies
+            result = function(*_copies(arguments))
+            copies = _copies(arguments)
+            start = time.perf_counter()
+            function(*copies)
+            milliseconds = (time.perf_counter() - start) * 1000
+            checks.append(Check(
+                kernel, name, milliseconds, float(np.abs(result - reference).max()),
+                result.shape == reference.shape and np.allclose(result, reference, rtol=1e-9, atol=1e-12)
+            ))
+    return checks
@@ -1,33 +1,234 @@
+import os
+import stat
+import tempfile
+import threading
 import typing as tp
+from dataclasses import dataclass
+
 import numpy.typing as npt
 import numpy as np
-from PyQt6.QtGui import QPixmap, QImage
 
 # <-- LAB 8 -->
 from .filtering import Filter
 
 from .storing import ImageHolder
+from .tracing import span, traced
+from .history import History, ImageMeta, Region
+from .edit_stack import EditStack, Operations
+from .memory import MemoryGuard
+from .operations import Operation, ImageState, FilterOperation, ScaleOperation, DitherOperation, \
+    AutocorrectOperation, ClaheOperation, StoreGammaOperation, ColorSpaceOperation
+from .pipeline import dump_pipeline, load_pipeline
 from .reading import read_image
+from .saving import ImageSaver
 from .colorspace import ColorSpace, RGBSpace
-from .utils import convert_gamma
-from .scaling import Scaler, OneDimensionScaler
-from .autocorrection import get_histograms, autocorrect
+from .utils import convert_gamma, clip_image, downscale, draw_gradient
+from .scaling import OneDimensionScaler
 from .dithering import ImageDitherer
 
 
+def _read_umask() -> int:
+    # os.umask can only be read by setting it, done once at import before any worker thread creates files
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = _read_umask()
+
+
+def _file_mode(path: str) -> int:
+    # The permissions a saved file gets: those of the file it replaces, or what the umask allows
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+@dataclass
+class Preview:
+    operation: Operation
+    state: ImageState
+    # logical size of the previewed result, the image itself may be a smaller proxy
+    height: int
+    width: int
+    full: bool
+    version: int
+
+
 class Backend:
-    def __init__(self):
+    PROXY_SIZE = 256
+    # files from this size on are memory-mapped instead of read
+    MMAP_THRESHOLD = 32 * 2 ** 20
+
+    def __init__(
+            self,
+            history_budget: int = 512 * 2 ** 20,
+            checkpoint_budget: int = 1024 * 2 ** 20,
+            working_budget: tp.Optional[int] = None,
+            memory_diagnostics: bool = False
+    ):
+        # working_budget caps the memory a single operation may allocate, see MemoryGuard
         self.image_holder = ImageHolder()
+        self.history = History(memory_budget=history_budget)
+        self.memory = MemoryGuard(working_budget, memory_diagnostics)
         self.colorspace: ColorSpace = RGBSpace()
         self.store_gamma: float = 0.0
         self.display_gamma: float = 0.0
         self.turnoff_layers: tp.List[bool, bool, bool] = [False, False, False]
+        self.preview: tp.Optional[Preview] = None
+        self._proxy: tp.Optional[tp.Tuple[int, npt.NDArray]] = None
+        self._lock = threading.RLock()
+        self.edit_stack = EditStack(memory_budget=checkpoint_budget, run=self.memory.run, lock=self._lock)
+        self.edit_stack.reset(self._state())
+
+    def _state(self) -> ImageState:
+        with self._lock:
+            holder = self.image_holder
+            return ImageState(holder.data, self.colorspace, self.store_gamma, holder.maxval)
+
+    @traced
+    def _commit(
+            self,
+            state: ImageState,
+            operations: Operations,
+            record: bool = True,
+            changed: tp.Optional[tp.List[Region]] = None
+    ) -> None:
+        # Operations may run on a worker thread: they compute from a snapshot
+        # and only publish the finished (already clipped) result here, all at once
+        with self._lock:
+            if record:
+                changed = self.history.record(
+                    self.image_holder.data, self._meta(self._state(), self.edit_stack.operations),
+                    state.image, self._meta(state, operations)
+                )
+            self.colorspace = state.colorspace
+            self.store_gamma = state.store_gamma
+            self.image_holder.set_image(state.image, in_range=True, maxval=state.maxval, changed=changed)
+            self.edit_stack.operations = operations
+            self.preview = None
+
+    @staticmethod
+    def _meta(state: ImageState, operations: Operations) -> ImageMeta:
+        return ImageMeta(
+            state.colorspace, state.store_gamma, state.image.shape, state.image.dtype,
+            operations=operations, maxval=state.maxval
+        )
+
+    def _reset(self, image: npt.NDArray, gamma: float, maxval: tp.Optional[int] = None) -> None:
+        # A new document, stored and displayed with the same gamma
+        with self._lock:
+            image.flags.writeable = False
+            state = ImageState(image, RGBSpace(), gamma, maxval)
+            self.display_gamma = gamma
+            self.edit_stack.reset(state)
+            self._commit(state, tuple(), record=False)
+            self.history.clear()
+
+    def _publish(self, state: ImageState, operations: Operations, version: int) -> bool:
+        # Commits a result computed off the lock, unless the image changed in the meantime
+        # (another file opened, undo, ...): it is then computed from an outdated snapshot and dropped
+        with self._lock:
+            if version != self.image_holder.version:
+                return False
+            self.edit_stack.cache(operations, state)
+            self._commit(state, operations)
+            return True
+
+    @traced
+    def apply(self, operation: Operation) -> bool:
+        with self._lock:
+            state, operations, version = self._state(), self.edit_stack.operations, self.image_holder.version
+        state = self.memory.run(operation, state)
+        return self._publish(state, operations + (operation,), version)
+
+    @traced
+    def undo(self) -> bool:
+        with self._lock:
+            return self._restore(self.history.undo(self.image_holder.data))
+
+    @traced
+    def redo(self) -> bool:
+        with self._lock:
+            return self._restore(self.history.redo(self.image_holder.data))
+
+    def _restore(self, restored: tp.Optional[History.Restored]) -> bool:
+        if restored is None:
+            return False
+        image, meta, changed = restored
+        state = ImageState(image, meta.colorspace, meta.store_gamma, meta.maxval)
+        self._commit(state, meta.operations, record=False, changed=changed)
+        return True
+
+    # Non-destructive editing of the recorded operations: recomputation starts
+    # from the closest cached checkpoint before the changed step
+    def get_operations(self) -> Operations:
+        return self.edit_stack.operations
 
-    def get_view(self) -> QPixmap:
-        image = self.image_holder.get_image()
+    @traced
+    def edit_operation(self, index: int, **params) -> bool:
+        with self._lock:
+            version = self.image_holder.version
+            operation = self.edit_stack.operations[index].with_params(**params)
+        operations, state = self.edit_stack.replace(index, operation)
+        return self._publish(state, operations, version)
 
-        rgb_image = np.clip(self.colorspace.to_rgb(image), 0, 1)
-        gamma_corrected_rgb_image = convert_gamma(rgb_image, self.store_gamma, self.display_gamma)
+    @traced
+    def remove_operation(self, index: int) -> bool:
+        with self._lock:
+            version = self.image_holder.version
+        operations, state = self.edit_stack.remove(index)
+        return self._publish(state, operations, version)
+
+    def save_pipeline(self, path: str) -> None:
+        dump_pipeline(self.get_operations(), path)
+
+    @traced
+    def apply_pipeline(self, path: str) -> bool:
+        for operation in load_pipeline(path):
+            if not self.apply(operation):
+                return False
+        return True
+
+    def get_size(self) -> tp.Tuple[int, int]:
+        preview = self.preview
+        if preview is not None:
+            return preview.height, preview.width
+        height, width, _ = self.image_holder.shape
+        return height, width
+
+    @traced
+    def render(
+            self,
+            region: tp.Optional[tp.Tuple[int, int, int, int]] = None,
+            zoom: float = 1.0,
+            out: tp.Optional[npt.NDArray[np.uint8]] = None
+    ) -> npt.NDArray[np.uint8]:
+        # region is (top, left, height, width) in view coordinates, i.e. already multiplied by zoom;
+        # the 8-bit RGB result is written into `out` when given, which may be a strided view
+        with self._lock:
+            image_height, image_width = self.get_size()
+            if region is None:
+                region = (0, 0, max(1, round(image_height * zoom)), max(1, round(image_width * zoom)))
+            top, left, height, width = region
+            rows = np.minimum(((np.arange(top, top + height) + .5) / zoom).astype(int), image_height - 1)
+            cols = np.minimum(((np.arange(left, left + width) + .5) / zoom).astype(int), image_width - 1)
+            with span("get_region", rows=len(rows), cols=len(cols)):
+                if self.preview is None:
+                    image = self.image_holder.get_region(rows, cols)
+                else:
+                    # a preview may be a downscaled proxy of its logical size
+                    source = self.preview.state.image
+                    rows = rows * source.shape[0] // image_height
+                    cols = cols * source.shape[1] // image_width
+                    image = source[np.ix_(rows, cols)]
+            colorspace, store_gamma = self.colorspace, self.store_gamma
+
+        with span("to_rgb", colorspace=colorspace.name()):
+            rgb_image = clip_image(colorspace.to_rgb(image))
+        with span("convert_gamma", gamma=store_gamma):
+            gamma_corrected_rgb_image = convert_gamma(rgb_image, store_gamma, self.display_gamma)
 
         gamma_corrected_rgb_image[:, :, self.turnoff_layers] = 0.0
         if sum(self.turnoff_layers) == 2:
@@ -38,35 +239,51 @@ class Backend:
             for i in range(3):
                 gamma_corrected_rgb_image[:, :, i] = value
 
-        scaled_image = np.array(gamma_corrected_rgb_image * 255, dtype=np.uint8)
-        height, width, channel = scaled_image.shape
-        bytes_per_line = 3 * width
-        image = QImage(scaled_image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-        return QPixmap.fromImage(image)
+        # scale, round and clip in place on the region's own float buffer, then one cast into `out`
+        with span("to_uint8", image=gamma_corrected_rgb_image):
+            np.multiply(gamma_corrected_rgb_image, 255, out=gamma_corrected_rgb_image)
+            np.rint(gamma_corrected_rgb_image, out=gamma_corrected_rgb_image)
+            np.clip(gamma_corrected_rgb_image, 0, 255, out=gamma_corrected_rgb_image)
+            if out is None:
+                out = np.empty((height, width, 3), dtype=np.uint8)
+            np.copyto(out, gamma_corrected_rgb_image, casting="unsafe")
+        return out
 
+    @traced
     def read_image(self, image_path: str) -> None:
-        image = read_image(image_path)
-        self.colorspace = RGBSpace()
-        self.store_gamma = 0.0
-        self.display_gamma = 0.0
-        self.image_holder.set_image(image)
+        mmap = os.path.getsize(image_path) >= self.MMAP_THRESHOLD
+        image, maxval = read_image(image_path, mmap)
+        self._reset(image, 0.0, maxval=maxval)
 
+    @traced
+    def save_image(self, writer: ImageSaver, image_path: str, maxval: int = 255) -> None:
+        # Write next to the target and rename over it: the current image may still
+        # be a memory map of that very file, which must not be truncated under it
+        with self._lock:
+            image, source_maxval = self.image_holder.data, self.image_holder.maxval
+        directory = os.path.dirname(os.path.abspath(image_path))
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as stream:
+            try:
+                writer.save(image, stream, maxval, source_maxval)
+            except BaseException:
+                stream.close()
+                os.remove(stream.name)
+                raise
+        # temporary files are created private, the saved one must not be
+        os.chmod(stream.name, _file_mode(image_path))
+        os.replace(stream.name, image_path)
+
+    @traced
+    def draw_gradient(self, height: int, width: int) -> None:
+        self._reset(draw_gradient(height, width), 1.0)
+
+    @traced
     def change_colorspace(self, colorspace: ColorSpace, convert: bool = True) -> None:
-        if convert:
-            old_stored_image = self.image_holder.get_image()
-            rgb_image = self.colorspace.to_rgb(old_stored_image)
-            new_stored_image = colorspace.from_rgb(rgb_image)
-            self.image_holder.set_image(new_stored_image)
-        self.colorspace = colorspace
+        self.apply(ColorSpaceOperation(colorspace, convert))
 
+    @traced
     def change_store_gamma(self, gamma: float) -> None:
-        image = self.image_holder.get_image()
-        rgb_image = self.colorspace.to_rgb(image)
-        linear_rgb_image = convert_gamma(rgb_image, self.store_gamma, 1.0)
-        reassigned_gamma_linear_rgb_image = convert_gamma(linear_rgb_image, 1.0, gamma)
-        reassigned_gamma_image = self.colorspace.from_rgb(reassigned_gamma_linear_rgb_image)
-        self.store_gamma = gamma
-        self.image_holder.set_image(reassigned_gamma_image)
+        self.apply(StoreGammaOperation(gamma))
 
     def change_display_gamma(self, value: float) -> None:
         self.display_gamma = value
@@ -75,33 +292,25 @@ class Backend:
         self.turnoff_layers[layer] = value
 
     # <-- LAB 5 -->
+    @traced
     def dither(self, image_dither: ImageDitherer, n_bits: int):
-        assert 1 <= n_bits <= 8, "Expected bits count from 1 to 8"
-        image = self.image_holder.get_image()
-        rgb_image = self.colorspace.to_rgb(image)
-        linear_rgb_image = convert_gamma(rgb_image, self.store_gamma, 1)
-        image = image_dither.dither(image=linear_rgb_image, n_bits=n_bits)
-        image = convert_gamma(image, 1, self.store_gamma)
-        self.image_holder.set_image(self.colorspace.from_rgb(image))
+        self.apply(DitherOperation(image_dither, n_bits))
 
     # <-- LAB 6 -->
-    def get_histograms(self):
-        view = self.image_holder.get_image() * 255
-        return get_histograms(np.round(view).astype(np.uint8))
+    @traced
+    def get_histograms(self) -> tp.Tuple[npt.NDArray[int], ...]:
+        return self.image_holder.histograms.channels()
 
+    @traced
     def autocorrect(self, noise: float):
-        assert 0 <= noise < 0.5, f"Expected noise in [0; 0,5), got {noise:.2g}"
-        image = self.image_holder.get_image()
-        image = autocorrect(
-            image=image,
-            noise=noise,
-            colorspace=self.colorspace,
-            store_gamma=self.store_gamma,
-            display_gamma=self.display_gamma
-        )
-        self.image_holder.set_image(image)
+        self.apply(AutocorrectOperation(noise, self.display_gamma))
+
+    @traced
+    def clahe(self, clip_limit: float, tiles: int):
+        self.apply(ClaheOperation(clip_limit, tiles))
 
     # <-- LAB 7 -->
+    @traced
     def scale_image(
             self,
             scaler: OneDimensionScaler,
@@ -109,22 +318,80 @@ class Backend:
             h_offset: int, w_offset: int,
             **kwargs
     ) -> None:
-        rgb_image = self.colorspace.to_rgb(self.image_holder.get_image())
-        linear_image = convert_gamma(rgb_image, self.store_gamma, 1)
-        scaled_linear_image = Scaler.scale(
-            odscaler=scaler,
-            image=linear_image,
-            height=height, width=width,
-            h_offset=h_offset, w_offset=w_offset,
-            **kwargs)
-        rgb_scaled_image = convert_gamma(scaled_linear_image, 1, self.store_gamma)
-        scaled_image = self.colorspace.from_rgb(rgb_scaled_image)
-        self.image_holder.set_image(scaled_image)
+        self.apply(ScaleOperation(scaler, height, width, h_offset, w_offset, **kwargs))
 
     # <-- LAB 8 -->
+    @traced
     def filter_image(self, image_filter: Filter) -> None:
-        rgb_image = self.colorspace.to_rgb(self.image_holder.get_image())
-        linear_image = convert_gamma(rgb_image, self.store_gamma, 1)
-        filtered_image = image_filter.apply_to(linear_image)
-        rgb_filtered_image = convert_gamma(filtered_image, 1, self.store_gamma)
-        self.image_holder.set_image(rgb_filtered_image)
+        self.apply(FilterOperation(image_filter))
+
+    # Preview: the operation is first run on a small cached proxy of the image,
+    # then (full=True, usually from a background job) on the image itself.
+    # Nothing is committed until commit_preview.
+    @traced
+    def get_proxy(self) -> tp.Tuple[npt.NDArray, int]:
+        with self._lock:
+            holder, version = self.image_holder, self.image_holder.version
+            if self._proxy is None or self._proxy[0] != version:
+                proxy = downscale(holder.data, self.PROXY_SIZE)
+                proxy = proxy / holder.maxval if holder.maxval is not None else proxy
+                # shared by every quick preview, operations must copy it rather than work in place
+                proxy.flags.writeable = False
+                self._proxy = (version, proxy)
+            return self._proxy[1], version
+
+    def _preview_source(self, full: bool) -> tp.Tuple[ImageState, int]:
+        with self._lock:
+            state = self._state()
+            if full:
+                return state, self.image_holder.version
+            proxy, version = self.get_proxy()
+            return ImageState(proxy, state.colorspace, state.store_gamma), version
+
+    @traced
+    def _preview(self, operation: Operation, height: int, width: int, full: bool) -> None:
+        state, version = self._preview_source(full)
+        state = self.memory.run(operation, state)
+        with self._lock:
+            if version == self.image_holder.version:
+                self.preview = Preview(operation, state, height, width, full, version)
+
+    @traced
+    def preview_filter(self, image_filter: Filter, full: bool = False) -> None:
+        height, width = self.image_holder.shape[:2]
+        if not full:
+            # blur radii are in pixels, on the proxy they shrink with it
+            image_filter = image_filter.scaled(self.get_proxy()[0].shape[0] / height)
+        self._preview(FilterOperation(image_filter), height, width, full)
+
+    @traced
+    def preview_scale(
+            self,
+            scaler: OneDimensionScaler,
+            height: int, width: int,
+            h_offset: int, w_offset: int,
+            full: bool = False,
+            **kwargs
+    ) -> None:
+        operation = ScaleOperation(scaler, height, width, h_offset, w_offset, **kwargs)
+        if not full:
+            ratio = self.get_proxy()[0].shape[0] / self.image_holder.shape[0]
+            operation = operation.with_params(
+                height=max(1, round(height * ratio)), width=max(1, round(width * ratio)),
+                h_offset=round(h_offset * ratio), w_offset=round(w_offset * ratio))
+        self._preview(operation, height, width, full)
+
+    @traced
+    def commit_preview(self) -> bool:
+        with self._lock:
+            preview = self.preview
+            if preview is None or not preview.full or preview.version != self.image_holder.version:
+                return False
+            operations = self.edit_stack.operations + (preview.operation,)
+            self.edit_stack.cache(operations, preview.state)
+            self._commit(preview.state, operations)
+            return True
+
+    def clear_preview(self) -> None:
+        with self._lock:
+            self.preview = None
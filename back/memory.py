@@ -0,0 +1,144 @@
+import collections
+import threading
+import tracemalloc
+import typing as tp
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from . import kernels
+from .operations import Operation, ImageState
+from .tasks import report_progress
+from .tracing import span
+from .utils import image_bytes
+
+# Bands and the context rows above them start on a multiple of this, so operations that
+# depend on the position (the 8x8 Bayer matrix of ordered dithering, also after a filter
+# in a fused chain) see the same pattern as on the whole image
+BAND_ALIGNMENT = 8
+MAX_RECORDS = 256
+
+
+class MemoryBudgetError(MemoryError):
+    pass
+
+
+@dataclass(frozen=True)
+class MemoryRecord:
+    operation: str
+    shape: tp.Tuple[int, ...]
+    estimate: int
+    # tracemalloc peak above the memory in use before the run
+    peak: int
+    # 1 when the operation ran on the whole image
+    bands: int
+
+    def describe(self) -> str:
+        ratio = f", {self.peak / self.estimate:.2f}x the estimate" if self.estimate else ""
+        bands = f" in {self.bands} bands" if self.bands > 1 else ""
+        return f"{self.operation}{bands}: peak {mib(self.peak)}, estimated {mib(self.estimate)}{ratio}"
+
+
+def mib(size: int) -> str:
+    return f"{size / 2 ** 20:.1f} MiB"
+
+
+def band_height(operation: Operation, state: ImageState, budget: int) -> tp.Optional[int]:
+    # The tallest band of rows that runs within the budget next to the full result, None when none does
+    halo = operation.halo()
+    if halo is None:
+        return None
+    height, width = state.image.shape[:2]
+    available = budget - image_bytes(height, width)
+    # estimates grow about linearly with the rows, the guess is then checked and lowered until it fits
+    rows = available * height // max(1, operation.estimate_bytes(state)) - 2 * halo
+    rows -= rows % BAND_ALIGNMENT
+    while rows >= BAND_ALIGNMENT:
+        band = replace(state, image=state.image[:min(height, rows + 2 * halo + BAND_ALIGNMENT - 1)])
+        if operation.estimate_bytes(band) <= available:
+            return rows
+        rows -= BAND_ALIGNMENT
+    return None
+
+
+def run_in_bands(operation: Operation, state: ImageState, rows: int) -> ImageState:
+    # Runs the operation on bands of rows with at least `halo` rows of context around each one;
+    # only the band's own rows of every result are kept
+    height, halo = state.image.shape[0], operation.halo()
+    result = None
+    for top in range(0, height, rows):
+        report_progress(top, height)
+        start = max(0, (top - halo) // BAND_ALIGNMENT * BAND_ALIGNMENT)
+        stop = min(height, top + rows + halo)
+        with span("band", top=top, rows=min(rows, height - top)):
+            band = operation.run(replace(state, image=state.image[start:stop]))
+        if result is None:
+            result = replace(band, image=np.empty((height,) + band.image.shape[1:], dtype=band.image.dtype))
+        result.image[top: top + rows] = band.image[top - start: top - start + rows]
+        # a band's result must be gone before the next one is computed
+        del band
+    result.image.flags.writeable = False
+    return result
+
+
+class MemoryGuard:
+    # Runs operations within a memory budget in bytes: an operation estimated over it runs
+    # in bands of rows if its result allows, and is refused otherwise. With diagnostics on,
+    # the tracemalloc peak of every run is recorded next to its estimate; tracemalloc then
+    # runs for the guard's lifetime and measured runs take turns, as the peak is process-wide.
+    def __init__(self, budget: tp.Optional[int] = None, diagnostics: bool = False):
+        self.budget = budget
+        self.diagnostics = diagnostics
+        self.records: tp.Deque[MemoryRecord] = collections.deque(maxlen=MAX_RECORDS)
+        self._setup()
+
+    def _setup(self) -> None:
+        self._measuring = threading.Lock()
+        if self.diagnostics and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __getstate__(self) -> tp.Dict[str, tp.Any]:
+        # batch.py sends the guard to its worker processes, which need a lock and tracemalloc of their own
+        state = self.__dict__.copy()
+        del state["_measuring"]
+        return state
+
+    def __setstate__(self, state: tp.Dict[str, tp.Any]) -> None:
+        self.__dict__.update(state)
+        self._setup()
+
+    def bands(self, operation: Operation, state: ImageState) -> tp.Optional[int]:
+        # Rows per band, None to run on the whole image
+        estimate = operation.estimate_bytes(state)
+        if self.budget is None or estimate <= self.budget:
+            return None
+        rows = band_height(operation, state, self.budget)
+        if rows is None:
+            reason = "needs the whole image" if operation.halo() is None else "does not fit even in bands"
+            raise MemoryBudgetError(
+                f"{operation.name()} needs about {mib(estimate)}, over the {mib(self.budget)} budget, "
+                f"and {reason}"
+            )
+        return rows
+
+    def run(self, operation: Operation, state: ImageState) -> ImageState:
+        rows = self.bands(operation, state)
+        if not self.diagnostics:
+            return operation.run(state) if rows is None else run_in_bands(operation, state, rows)
+
+        with self._measuring:
+            # JIT compilation is not the operation's memory, it happens before the first measurement
+            kernels.warm_up()
+            if not tracemalloc.is_tracing():
+                # stopped by someone else, e.g. a tracing session that started it first
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = operation.run(state) if rows is None else run_in_bands(operation, state, rows)
+            peak = tracemalloc.get_traced_memory()[1] - before
+        height = state.image.shape[0]
+        self.records.append(MemoryRecord(
+            operation.describe(), state.image.shape, operation.estimate_bytes(state), peak,
+            1 if rows is None else -(-height // rows)
+        ))
+        return result
@@ -0,0 +1,184 @@
+import numba
+import numpy as np
+import numpy.typing as npt
+
+from .kernels import Taps, register
+from .tasks import report_progress
+
+# Compiled versions of the kernels in back/kernels.py, imported only when numba is installed.
+# They work on bands of rows so progress is still reported and jobs can be cancelled.
+ROWS_PER_CALL = 32
+
+
+@numba.njit(cache=True)
+def _diffuse_rows(image, start, stop, tap_rows, tap_columns, weights, divisor):
+    height, width, layers = image.shape
+    for i in range(start, stop):
+        for j in range(width):
+            for layer in range(layers):
+                value = image[i, j, layer]
+                rounded = np.round(value)
+                error = (value - rounded) / divisor
+                for tap in range(weights.shape[0]):
+                    target_i, target_j = i + tap_rows[tap], j + tap_columns[tap]
+                    if target_i < height and 0 <= target_j < width:
+                        image[target_i, target_j, layer] += error * weights[tap]
+                image[i, j, layer] = rounded
+
+
+@register("error_diffusion", "numba")
+def error_diffusion(image: npt.NDArray[np.float64], taps: Taps, divisor: float) -> npt.NDArray[np.float64]:
+    tap_rows = np.array([tap[0] for tap in taps], dtype=np.int64)
+    tap_columns = np.array([tap[1] for tap in taps], dtype=np.int64)
+    weights = np.array([tap[2] for tap in taps], dtype=np.float64)
+    height = image.shape[0]
+    for start in range(0, height, ROWS_PER_CALL):
+        report_progress(start, height)
+        _diffuse_rows(image, start, min(height, start + ROWS_PER_CALL), tap_rows, tap_columns, weights, float(divisor))
+    return image
+
+
+@numba.njit(cache=True)
+def _correlate_rows(padded, kernel, result, start, stop):
+    size = kernel.shape[0]
+    width, layers = result.shape[1], result.shape[2]
+    for i in range(start, stop):
+        for j in range(width):
+            for layer in range(layers):
+                total = 0.0
+                for dy in range(size):
+                    for dx in range(size):
+                        total += padded[i + dy, j + dx, layer] * kernel[dy, dx]
+                result[i, j, layer] = total
+
+
+@register("correlate", "numba")
+def correlate(padded: npt.NDArray, kernel: npt.NDArray) -> npt.NDArray:
+    size = kernel.shape[0]
+    height, width = padded.shape[0] - size + 1, padded.shape[1] - size + 1
+    result = np.empty((height, width) + padded.shape[2:])
+    padded = np.ascontiguousarray(padded, dtype=np.float64)
+    kernel = np.ascontiguousarray(kernel, dtype=np.float64)
+    for start in range(0, height, ROWS_PER_CALL):
+        report_progress(start, height)
+        _correlate_rows(padded, kernel, result, start, min(height, start + ROWS_PER_CALL))
+    return result
+
+
+@numba.njit(cache=True)
+def _select(values, k):
+    # The k-th smallest of values, which are reordered (quickselect)
+    low, high = 0, values.shape[0] - 1
+    while low < high:
+        pivot = values[(low + high) // 2]
+        i, j = low, high
+        while i <= j:
+            while values[i] < pivot:
+                i += 1
+            while values[j] > pivot:
+                j -= 1
+            if i <= j:
+                values[i], values[j] = values[j], values[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            high = j
+        elif k >= i:
+            low = i
+        else:
+            break
+    return values[k]
+
+
+@numba.njit(cache=True)
+def _median_rows(padded, size, result, start, stop):
+    # size is odd, the median is the middle element of the window
+    width, layers = result.shape[1], result.shape[2]
+    window = np.empty(size * size)
+    for i in range(start, stop):
+        for j in range(width):
+            for layer in range(layers):
+                for dy in range(size):
+                    for dx in range(size):
+                        window[dy * size + dx] = padded[i + dy, j + dx, layer]
+                result[i, j, layer] = _select(window, size * size // 2)
+
+
+@register("median", "numba")
+def median(padded: npt.NDArray, size: int) -> npt.NDArray:
+    height, width = padded.shape[0] - size + 1, padded.shape[1] - size + 1
+    result = np.empty((height, width) + padded.shape[2:])
+    padded = np.ascontiguousarray(padded, dtype=np.float64)
+    for start in range(0, height, ROWS_PER_CALL):
+        report_progress(start, height)
+        _median_rows(padded, size, result, start, min(height, start + ROWS_PER_CALL))
+    return result
+
+
+@numba.njit(cache=True)
+def _resample_rows(image, indices, weights, result, start, stop):
+    width, layers = result.shape[1], result.shape[2]
+    for i in range(start, stop):
+        for j in range(width):
+            for layer in range(layers):
+                total = 0.0
+                for tap in range(indices.shape[1]):
+                    total += image[i, indices[j, tap], layer] * weights[j, tap]
+                result[i, j, layer] = total
+
+
+@register("resample", "numba")
+def resample(image: npt.NDArray, indices: npt.NDArray[np.intp], weights: npt.NDArray) -> npt.NDArray:
+    height = image.shape[0]
+    result = np.empty((height, indices.shape[0]) + image.shape[2:], dtype=image.dtype)
+    image = np.ascontiguousarray(image)
+    indices = np.ascontiguousarray(indices, dtype=np.int64)
+    weights = np.ascontiguousarray(weights, dtype=np.float64)
+    for start in range(0, height, ROWS_PER_CALL):
+        report_progress(start, height)
+        _resample_rows(image, indices, weights, result, start, min(height, start + ROWS_PER_CALL))
+    return result
+
+
+@numba.njit(cache=True)
+def _unfilter_rows(kinds, filtered, prev, bpp, out):
+    rows, stride = filtered.shape
+    for i in range(rows):
+        above = prev if i == 0 else out[i - 1]
+        kind = kinds[i]
+        for k in range(stride):
+            a = np.int32(out[i, k - bpp]) if k >= bpp else np.int32(0)
+            b = np.int32(above[k])
+            c = np.int32(above[k - bpp]) if k >= bpp else np.int32(0)
+            if kind == 0:
+                prediction = np.int32(0)
+            elif kind == 1:
+                prediction = a
+            elif kind == 2:
+                prediction = b
+            elif kind == 3:
+                prediction = (a + b) >> 1
+            else:
+                pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - c - c)
+                if pa <= pb and pa <= pc:
+                    prediction = a
+                elif pb <= pc:
+                    prediction = b
+                else:
+                    prediction = c
+            out[i, k] = (np.int32(filtered[i, k]) + prediction) & 0xFF
+
+
+@register("unfilter", "numba")
+def unfilter(
+        kinds: npt.NDArray[np.uint8],
+        filtered: npt.NDArray[np.uint8],
+        prev: npt.NDArray[np.uint8],
+        bpp: int,
+        out: npt.NDArray[np.uint8]
+) -> npt.NDArray[np.uint8]:
+    _unfilter_rows(
+        np.ascontiguousarray(kinds, dtype=np.uint8), np.ascontiguousarray(filtered),
+        np.ascontiguousarray(prev), bpp, out
+    )
+    return out
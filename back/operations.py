@@ -0,0 +1,385 @@
+import typing as tp
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, replace
+from inspect import signature
+
+import numpy.typing as npt
+
+from .colorspace import ColorSpace
+from .utils import convert_gamma, clip_image, image_bytes
+from .tracing import span
+from .filtering import Filter
+from .scaling import Scaler, OneDimensionScaler
+from .dithering import ImageDitherer
+from .autocorrection import autocorrect, autocorrect_samples, clahe
+
+
+@dataclass(frozen=True)
+class ImageState:
+    image: npt.NDArray
+    colorspace: ColorSpace
+    store_gamma: float
+    # set while image still holds the integer samples it was read with
+    maxval: tp.Optional[int] = None
+
+    def promoted(self) -> 'ImageState':
+        if self.maxval is None:
+            return self
+        image = self.image / self.maxval
+        image.flags.writeable = False
+        return replace(self, image=image, maxval=None)
+
+
+class Operation(ABC):
+    # True when the result is guaranteed to lie in [0, 1] and needs no clipping
+    in_range: bool = False
+    # False for operations that can work on the integer samples as they are
+    needs_float: bool = True
+    # Float images apply() holds at its peak, the result included, see working_bytes
+    working_copies: float = 2
+
+    @abstractmethod
+    def name(self) -> str:
+        pass
+
+    @abstractmethod
+    def params(self) -> tp.Dict[str, tp.Any]:
+        pass
+
+    @abstractmethod
+    def with_params(self, **params) -> 'Operation':
+        pass
+
+    @abstractmethod
+    def apply(self, state: ImageState) -> ImageState:
+        pass
+
+    def run(self, state: ImageState) -> ImageState:
+        # apply() followed by the clipping ImageHolder would do, so results can be cached and chained
+        with span(self.name(), "operation", image=state.image) as trace:
+            if self.needs_float and state.maxval is not None:
+                with span("promote", image=state.image):
+                    state = state.promoted()
+            with span("apply"):
+                state = self.apply(state)
+            image = state.image
+            if not self.in_range and state.maxval is None:
+                with span("clip_image", image=image):
+                    image = clip_image(image)
+            image.flags.writeable = False
+            trace.annotate(result=image)
+        return replace(state, image=image)
+
+    def describe(self) -> str:
+        params = ", ".join(f"{key}={value}" for key, value in self.params().items())
+        return f"{self.name()}({params})"
+
+    def halo(self) -> tp.Optional[int]:
+        # Rows of context a band of rows needs to be computed exactly on its own,
+        # None when the result depends on the whole image
+        return None
+
+    def output_size(self, height: int, width: int) -> tp.Tuple[int, int]:
+        return height, width
+
+    def estimate_bytes(self, state: ImageState) -> int:
+        # Memory run() allocates at its peak on top of its input, from the shape and parameters alone
+        height, width = state.image.shape[:2]
+        promoted = image_bytes(height, width) if self.needs_float and state.maxval is not None else 0
+        return promoted + self.working_bytes(height, width)
+
+    def working_bytes(self, height: int, width: int) -> int:
+        return round(self.working_copies * image_bytes(height, width))
+
+
+class LinearOperation(Operation):
+    # Operations that work on linear RGB, whatever the stored colorspace and gamma are.
+    # The result is clipped in linear RGB before it is converted back, as between the steps
+    # of a LinearChain, so fused and separate steps clip the same way (and a power gamma
+    # never sees negative values).
+
+    def apply(self, state: ImageState) -> ImageState:
+        colorspace = state.colorspace.name()
+        with span("to_rgb", colorspace=colorspace):
+            rgb_image = state.colorspace.to_rgb(state.image)
+            if rgb_image is not state.image:
+                # stored values in range may still lie outside the RGB cube, as render() clips them
+                rgb_image = clip_image(rgb_image)
+        with span("convert_gamma", gamma=state.store_gamma):
+            linear_image = convert_gamma(rgb_image, state.store_gamma, 1)
+        with span("apply_linear", image=linear_image) as trace:
+            result = clip_image(self.apply_linear(linear_image))
+            trace.annotate(result=result)
+        with span("convert_gamma", gamma=state.store_gamma):
+            rgb_result = convert_gamma(result, 1, state.store_gamma)
+        with span("from_rgb", colorspace=colorspace):
+            image = state.colorspace.from_rgb(rgb_result)
+        return replace(state, image=image)
+
+    @abstractmethod
+    def apply_linear(self, image: npt.NDArray) -> npt.NDArray:
+        pass
+
+    def working_bytes(self, height: int, width: int) -> int:
+        # to_rgb and gamma conversions of the input, apply_linear, then the same back for its result;
+        # a conversion holds about one and a half images of temporaries besides what it returns
+        result = image_bytes(*self.output_size(height, width))
+        return 3 * image_bytes(height, width) + self.linear_bytes(height, width) + 3 * result
+
+    def linear_bytes(self, height: int, width: int) -> int:
+        # Memory apply_linear allocates at its peak, the result included
+        return 2 * image_bytes(*self.output_size(height, width))
+
+
+class LinearChain(LinearOperation):
+    # Consecutive linear operations sharing one to_rgb/gamma round trip. Every step is
+    # clipped in linear RGB, as LinearOperation.apply does for a step on its own.
+    def __init__(self, operations: tp.Sequence[LinearOperation]):
+        self.operations = tuple(operations)
+
+    def name(self) -> str:
+        return " -> ".join(operation.name() for operation in self.operations)
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict()
+
+    def with_params(self, **params) -> 'LinearChain':
+        return LinearChain(self.operations)
+
+    def describe(self) -> str:
+        return " -> ".join(operation.describe() for operation in self.operations)
+
+    def halo(self) -> tp.Optional[int]:
+        halos = [operation.halo() for operation in self.operations]
+        return None if None in halos else sum(halos)
+
+    def output_size(self, height: int, width: int) -> tp.Tuple[int, int]:
+        for operation in self.operations:
+            height, width = operation.output_size(height, width)
+        return height, width
+
+    def linear_bytes(self, height: int, width: int) -> int:
+        peak = 0
+        for operation in self.operations:
+            peak = max(peak, operation.linear_bytes(height, width))
+            height, width = operation.output_size(height, width)
+        return peak
+
+    def apply_linear(self, image: npt.NDArray) -> npt.NDArray:
+        for operation in self.operations[:-1]:
+            with span(operation.name()):
+                image = clip_image(operation.apply_linear(image))
+        with span(self.operations[-1].name()):
+            return self.operations[-1].apply_linear(image)
+
+
+class FilterOperation(LinearOperation):
+    def __init__(self, image_filter: Filter):
+        self.image_filter = image_filter
+
+    def name(self) -> str:
+        return self.image_filter.name()
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        filter_signature = signature(type(self.image_filter))
+        return {arg: getattr(self.image_filter, arg) for arg in filter_signature.parameters}
+
+    def with_params(self, **params) -> 'FilterOperation':
+        return FilterOperation(type(self.image_filter)(**{**self.params(), **params}))
+
+    def halo(self) -> tp.Optional[int]:
+        return self.image_filter.halo()
+
+    def linear_bytes(self, height: int, width: int) -> int:
+        return self.image_filter.estimate_bytes(height, width)
+
+    def apply_linear(self, image: npt.NDArray) -> npt.NDArray:
+        return self.image_filter.apply_to(image)
+
+
+class ScaleOperation(LinearOperation):
+    def __init__(
+            self,
+            scaler: OneDimensionScaler,
+            height: int, width: int,
+            h_offset: int = 0, w_offset: int = 0,
+            **kwargs
+    ):
+        self.scaler = scaler
+        self.height, self.width = height, width
+        self.h_offset, self.w_offset = h_offset, w_offset
+        self.kwargs = kwargs
+
+    def name(self) -> str:
+        return f"Scale {self.scaler.name()}"
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict(
+            height=self.height, width=self.width,
+            h_offset=self.h_offset, w_offset=self.w_offset,
+            **self.kwargs
+        )
+
+    def with_params(self, **params) -> 'ScaleOperation':
+        return ScaleOperation(self.scaler, **{**self.params(), **params})
+
+    def output_size(self, height: int, width: int) -> tp.Tuple[int, int]:
+        return self.height, self.width
+
+    def linear_bytes(self, height: int, width: int) -> int:
+        # Scaler.scale resizes along the axis that grows more first, then along the other one
+        if self.height / height > self.width / width:
+            intermediate = image_bytes(self.height, width)
+        else:
+            intermediate = image_bytes(height, self.width)
+        return intermediate + image_bytes(self.height, self.width)
+
+    def apply_linear(self, image: npt.NDArray) -> npt.NDArray:
+        return Scaler.scale(
+            odscaler=self.scaler,
+            image=image,
+            height=self.height, width=self.width,
+            h_offset=self.h_offset, w_offset=self.w_offset,
+            **self.kwargs)
+
+
+class DitherOperation(LinearOperation):
+    def __init__(self, ditherer: ImageDitherer, n_bits: int):
+        assert 1 <= n_bits <= 8, "Expected bits count from 1 to 8"
+        self.ditherer = ditherer
+        self.n_bits = n_bits
+
+    def name(self) -> str:
+        return f"Dither {self.ditherer.name()}"
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict(n_bits=self.n_bits)
+
+    def with_params(self, **params) -> 'DitherOperation':
+        return DitherOperation(self.ditherer, **{**self.params(), **params})
+
+    def halo(self) -> tp.Optional[int]:
+        return self.ditherer.halo()
+
+    def linear_bytes(self, height: int, width: int) -> int:
+        return self.ditherer.estimate_bytes(height, width)
+
+    def apply_linear(self, image: npt.NDArray) -> npt.NDArray:
+        return self.ditherer.dither(image=image, n_bits=self.n_bits)
+
+
+class AutocorrectOperation(Operation):
+    in_range = True
+    # integer samples go through a lookup table instead of being promoted
+    needs_float = False
+    working_copies = 3
+
+    def __init__(self, noise: float, display_gamma: float = 0.0):
+        assert 0 <= noise < 0.5, f"Expected noise in [0; 0,5), got {noise:.2g}"
+        self.noise = noise
+        self.display_gamma = display_gamma
+
+    def name(self) -> str:
+        return "Autocorrection"
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict(noise=self.noise, display_gamma=self.display_gamma)
+
+    def with_params(self, **params) -> 'AutocorrectOperation':
+        return AutocorrectOperation(**{**self.params(), **params})
+
+    def apply(self, state: ImageState) -> ImageState:
+        if state.maxval is not None:
+            image = autocorrect_samples(
+                samples=state.image,
+                maxval=state.maxval,
+                noise=self.noise,
+                colorspace=state.colorspace,
+                store_gamma=state.store_gamma,
+                display_gamma=self.display_gamma
+            )
+            return replace(state, image=image, maxval=None)
+        image = autocorrect(
+            image=state.image,
+            noise=self.noise,
+            colorspace=state.colorspace,
+            store_gamma=state.store_gamma,
+            display_gamma=self.display_gamma
+        )
+        return replace(state, image=image)
+
+
+class ClaheOperation(Operation):
+    working_copies = 6
+
+    def __init__(self, clip_limit: float = 2.0, tiles: int = 8):
+        assert clip_limit >= 1, f"Expected clip limit of at least 1, got {clip_limit:.2g}"
+        assert tiles >= 1, f"Expected at least one tile, got {tiles}"
+        self.clip_limit = clip_limit
+        self.tiles = tiles
+
+    def name(self) -> str:
+        return "CLAHE"
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict(clip_limit=self.clip_limit, tiles=self.tiles)
+
+    def with_params(self, **params) -> 'ClaheOperation':
+        return ClaheOperation(**{**self.params(), **params})
+
+    def apply(self, state: ImageState) -> ImageState:
+        return replace(state, image=clahe(state.image, state.colorspace, self.clip_limit, self.tiles))
+
+
+class StoreGammaOperation(Operation):
+    working_copies = 7
+
+    def __init__(self, gamma: float):
+        self.gamma = gamma
+
+    def halo(self) -> tp.Optional[int]:
+        return 0
+
+    def name(self) -> str:
+        return "Store Gamma"
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict(gamma=self.gamma)
+
+    def with_params(self, **params) -> 'StoreGammaOperation':
+        return StoreGammaOperation(**{**self.params(), **params})
+
+    def apply(self, state: ImageState) -> ImageState:
+        rgb_image = state.colorspace.to_rgb(state.image)
+        linear_rgb_image = convert_gamma(rgb_image, state.store_gamma, 1.0)
+        reassigned_gamma_linear_rgb_image = convert_gamma(linear_rgb_image, 1.0, self.gamma)
+        reassigned_gamma_image = state.colorspace.from_rgb(reassigned_gamma_linear_rgb_image)
+        return replace(state, image=reassigned_gamma_image, store_gamma=self.gamma)
+
+
+class ColorSpaceOperation(Operation):
+    def __init__(self, colorspace: ColorSpace, convert: bool = True):
+        self.colorspace = colorspace
+        self.convert = convert
+        # relabelling keeps the already clipped image as it is, integer samples included
+        self.in_range = not convert
+        self.needs_float = convert
+        self.working_copies = 7 if convert else 0
+
+    def halo(self) -> tp.Optional[int]:
+        return 0
+
+    def name(self) -> str:
+        return f"Colorspace {self.colorspace.name()}"
+
+    def params(self) -> tp.Dict[str, tp.Any]:
+        return dict(convert=self.convert)
+
+    def with_params(self, **params) -> 'ColorSpaceOperation':
+        return ColorSpaceOperation(self.colorspace, **{**self.params(), **params})
+
+    def apply(self, state: ImageState) -> ImageState:
+        image = state.image
+        if self.convert:
+            image = self.colorspace.from_rgb(state.colorspace.to_rgb(image))
+        return replace(state, image=image, colorspace=self.colorspace)
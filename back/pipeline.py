@@ -0,0 +1,151 @@
+import json
+import typing as tp
+from dataclasses import dataclass
+
+from . import colorspace, dithering, filtering, scaling
+from .memory import MemoryGuard
+from .operations import Operation, LinearOperation, LinearChain, ImageState, FilterOperation, ScaleOperation, \
+    DitherOperation, AutocorrectOperation, ClaheOperation, StoreGammaOperation, ColorSpaceOperation
+
+# A pipeline is a JSON list of steps (or an object with a "steps" list), applied in order:
+#   {"op": "colorspace", "name": "HSLSpace", "args": {"convert": true}}
+#   {"op": "gamma", "args": {"gamma": 2.2}}
+#   {"op": "filter", "name": "GaussianFilter", "args": {"sigma": 2}}
+#   {"op": "scale", "name": "LanczosScaler", "args": {"height": 512, "width": 512}}
+#   {"op": "dither", "name": "FloydSteinbergDitherer", "args": {"n_bits": 1}}
+#   {"op": "autocorrect", "args": {"noise": 0.01}}
+#   {"op": "clahe", "args": {"clip_limit": 2.0, "tiles": 8}}
+Step = tp.Dict[str, tp.Any]
+
+
+class PipelineError(ValueError):
+    pass
+
+
+# op -> (operation class, module and base class "name" is looked up in, if the operation takes one)
+OPERATIONS: tp.Dict[str, tp.Tuple[type, tp.Optional[tp.Tuple[tp.Any, type]]]] = {
+    "colorspace": (ColorSpaceOperation, (colorspace, colorspace.ColorSpace)),
+    "gamma": (StoreGammaOperation, None),
+    "filter": (FilterOperation, (filtering, filtering.Filter)),
+    "scale": (ScaleOperation, (scaling, scaling.OneDimensionScaler)),
+    "dither": (DitherOperation, (dithering, dithering.ImageDitherer)),
+    "autocorrect": (AutocorrectOperation, None),
+    "clahe": (ClaheOperation, None),
+}
+
+
+def find_class(module, name: str, base: type) -> type:
+    cls = getattr(module, name, None) if isinstance(name, str) else None
+    if not isinstance(cls, type) or not issubclass(cls, base) or cls is base:
+        raise PipelineError(f"unknown {base.__name__} '{name}'")
+    return cls
+
+
+def build_operation(step: Step) -> Operation:
+    if not isinstance(step, dict):
+        raise PipelineError("expected an object")
+    unknown = set(step) - {"op", "name", "args"}
+    if unknown:
+        raise PipelineError(f"unknown keys {sorted(unknown)}")
+    if step.get("op") not in OPERATIONS:
+        raise PipelineError(f"unknown op '{step.get('op')}', expected one of {sorted(OPERATIONS)}")
+    args = step.get("args", dict())
+    if not isinstance(args, dict):
+        raise PipelineError("args must be an object")
+
+    operation, lookup = OPERATIONS[step["op"]]
+    if lookup is None and "name" in step:
+        raise PipelineError(f"op '{step['op']}' takes no name")
+    try:
+        if lookup is None:
+            return operation(**args)
+        module, base = lookup
+        cls = find_class(module, step.get("name"), base)
+        if operation is FilterOperation:
+            return operation(cls(**args))
+        return operation(cls(), **args)
+    except (TypeError, AssertionError) as e:
+        raise PipelineError(str(e))
+
+
+def to_step(operation: Operation) -> Step:
+    # The inverse of build_operation, so any edit stack can be saved as a pipeline
+    if isinstance(operation, FilterOperation):
+        return dict(op="filter", name=type(operation.image_filter).__name__, args=operation.params())
+    if isinstance(operation, ScaleOperation):
+        return dict(op="scale", name=type(operation.scaler).__name__, args=operation.params())
+    if isinstance(operation, DitherOperation):
+        return dict(op="dither", name=type(operation.ditherer).__name__, args=operation.params())
+    if isinstance(operation, ColorSpaceOperation):
+        return dict(op="colorspace", name=type(operation.colorspace).__name__, args=operation.params())
+    if isinstance(operation, StoreGammaOperation):
+        return dict(op="gamma", args=operation.params())
+    if isinstance(operation, AutocorrectOperation):
+        return dict(op="autocorrect", args=operation.params())
+    if isinstance(operation, ClaheOperation):
+        return dict(op="clahe", args=operation.params())
+    if isinstance(operation, LinearChain):
+        raise PipelineError("compiled chains can not be saved, save the operations they were built from")
+    raise PipelineError(f"operation {operation.name()} has no pipeline step")
+
+
+def parse_pipeline(pipeline: tp.Union[tp.List[Step], tp.Dict[str, tp.Any]]) -> tp.List[Operation]:
+    # Validates every step before anything runs and reports all broken steps at once
+    steps = pipeline.get("steps") if isinstance(pipeline, dict) else pipeline
+    if not isinstance(steps, list):
+        raise PipelineError("expected a list of steps")
+    operations, errors = list(), list()
+    for index, step in enumerate(steps):
+        try:
+            operations.append(build_operation(step))
+        except PipelineError as e:
+            errors.append(f"step {index}: {e}")
+    if errors:
+        raise PipelineError("\n".join(errors))
+    return operations
+
+
+def load_pipeline(path: str) -> tp.List[Operation]:
+    with open(path) as stream:
+        try:
+            pipeline = json.load(stream)
+        except json.JSONDecodeError as e:
+            raise PipelineError(f"{path}: {e}")
+    return parse_pipeline(pipeline)
+
+
+def dump_pipeline(operations: tp.Iterable[Operation], path: str) -> None:
+    with open(path, "w") as stream:
+        json.dump({"steps": [to_step(operation) for operation in operations]}, stream, indent=2)
+
+
+@dataclass(frozen=True)
+class Plan:
+    operations: tp.Tuple[Operation, ...]
+
+    def run(self, state: ImageState, guard: tp.Optional[MemoryGuard] = None) -> ImageState:
+        for operation in self.operations:
+            state = operation.run(state) if guard is None else guard.run(operation, state)
+        return state
+
+    def describe(self) -> str:
+        return "\n".join(operation.describe() for operation in self.operations)
+
+
+def compile_plan(operations: tp.Iterable[Operation]) -> Plan:
+    # Runs of linear operations are merged, so the image goes to linear RGB
+    # and back once per run instead of once per operation
+    plan: tp.List[Operation] = list()
+    run: tp.List[LinearOperation] = list()
+    for operation in list(operations) + [None]:
+        if isinstance(operation, LinearOperation):
+            run.append(operation)
+            continue
+        if len(run) > 1:
+            plan.append(LinearChain(run))
+        else:
+            plan.extend(run)
+        run = list()
+        if operation is not None:
+            plan.append(operation)
+    return Plan(tuple(plan))
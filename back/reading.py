@@ -1,3 +1,7 @@
+import os
+import re
+import struct
+import zlib
 from dataclasses import dataclass
 import typing as tp
 from abc import ABC, abstractmethod
@@ -5,10 +9,13 @@ from abc import ABC, abstractmethod
 import numpy as np
 import numpy.typing as npt
 
+from . import kernels
+
 
 class ImageReader(ABC):
     @abstractmethod
-    def read(self, stream: tp.BinaryIO) -> npt.NDArray:
+    def read(self, stream: tp.BinaryIO, mmap: bool = False) -> tp.Tuple[npt.NDArray, int]:
+        # Returns the integer samples and the maxval they are relative to
         pass
 
 
@@ -16,63 +23,304 @@ class ImageReader(ABC):
 class PNMMetaData:
     height: int
     width: int
+    maxval: int = 255
+    # samples per pixel in the file, alpha included
+    depth: int = 3
+
+
+def sample_dtype(maxval: int) -> np.dtype:
+    # PNM stores one byte per sample up to maxval 255, two big-endian bytes above
+    assert 0 < maxval < 2 ** 16, f"Unsupported maxval {maxval}"
+    return np.dtype(np.uint8) if maxval < 2 ** 8 else np.dtype(">u2")
+
+
+def expand_channels(arr: npt.NDArray) -> npt.NDArray:
+    # (height, width, depth) samples to RGB: alpha is dropped and gray becomes
+    # a read-only view that repeats the gray channel without copying it
+    height, width, depth = arr.shape
+    if depth in (1, 2):
+        return np.broadcast_to(arr[:, :, :1], (height, width, 3))
+    return arr[:, :, :3]
+
+
+def read_tokens(stream: tp.BinaryIO, count: int) -> tp.List[bytes]:
+    # Header tokens are separated by any whitespace and '#' comments run to the end of the line.
+    # Exactly one whitespace character after the last token is consumed, as the raster starts there.
+    tokens, token = list(), b""
+    while len(tokens) < count:
+        c = stream.read(1)
+        assert c, "Unexpected end of header"
+        if c == b"#":
+            stream.readline()
+            c = b"\n"
+        if c.isspace():
+            if token:
+                tokens.append(token)
+                token = b""
+        else:
+            token += c
+    return tokens
+
+
+def read_numbers(stream: tp.BinaryIO, count: int) -> tp.List[int]:
+    tokens = read_tokens(stream, count)
+    assert all(token.isdigit() for token in tokens)
+    return [int(token) for token in tokens]
 
 
 class PNMReader(ImageReader):
+    depth: int
+    has_maxval = True
+    ROWS_PER_CHUNK = 64
 
-    def read(self, stream: tp.BinaryIO) -> npt.NDArray:
+    def read(self, stream: tp.BinaryIO, mmap: bool = False) -> tp.Tuple[npt.NDArray, int]:
+        # mmap: map the pixel section of the file instead of reading it,
+        # pages are then only loaded when touched
         try:
             meta = self.read_meta(stream)
         except AssertionError:
             raise Exception("Broken file")
-        arr = np.frombuffer(stream.read(), dtype=np.uint8)
-        return self.reshape(meta, arr / 255)
+        arr = self.read_raster(stream, meta, mmap)
+        return self.reshape(meta, arr), meta.maxval
+
+    def read_meta(self, stream: tp.BinaryIO) -> PNMMetaData:
+        if self.has_maxval:
+            width, height, maxval = read_numbers(stream, 3)
+        else:
+            (width, height), maxval = read_numbers(stream, 2), 1
+        return PNMMetaData(height, width, maxval, self.depth)
+
+    def read_raster(self, stream: tp.BinaryIO, meta: PNMMetaData, mmap: bool) -> npt.NDArray:
+        dtype = sample_dtype(meta.maxval)
+        size = meta.height * meta.width * meta.depth
+        if mmap:
+            offset = stream.tell()
+            assert os.fstat(stream.fileno()).st_size - offset >= size * dtype.itemsize, "Invalid image size"
+            return np.memmap(stream.name, dtype=dtype, mode="r", offset=offset, shape=(size,))
+        return self.read_samples(stream, size, dtype, meta.width * meta.depth)
+
+    @classmethod
+    def read_samples(cls, stream: tp.BinaryIO, size: int, dtype: np.dtype, row_size: int) -> npt.NDArray:
+        # Reads straight into the result in chunks of rows, the bytes are only
+        # reinterpreted, never copied through an intermediate string
+        arr = np.empty(size, dtype=dtype)
+        buffer = memoryview(arr.view(np.uint8))
+        chunk = cls.ROWS_PER_CHUNK * row_size * dtype.itemsize
+        for start in range(0, len(buffer), chunk):
+            part = buffer[start: start + chunk]
+            assert stream.readinto(part) == len(part), "Invalid image size"
+        return arr
 
     @staticmethod
-    @abstractmethod
-    def reshape(metadata, arr: npt.NDArray) -> npt.NDArray:
-        pass
+    def reshape(metadata: PNMMetaData, arr: npt.NDArray) -> npt.NDArray:
+        height, width, depth = metadata.height, metadata.width, metadata.depth
+        assert arr.size == height * width * depth, "Invalid image size"
+        return expand_channels(arr.reshape((height, width, depth)))
+
+
+class P6Reader(PNMReader):
+    depth = 3
+
+
+class P5Reader(PNMReader):
+    depth = 1
+
+
+class P4Reader(PNMReader):
+    depth = 1
+    has_maxval = False
+
+    def read_raster(self, stream: tp.BinaryIO, meta: PNMMetaData, mmap: bool) -> npt.NDArray:
+        # Rows are packed 8 pixels per byte and padded to whole bytes, 1 is black
+        row_bytes = (meta.width + 7) // 8
+        packed = self.read_samples(stream, meta.height * row_bytes, np.dtype(np.uint8), row_bytes)
+        bits = np.unpackbits(packed.reshape((meta.height, row_bytes)), axis=1)[:, :meta.width]
+        return np.subtract(1, bits, out=bits).ravel()
+
+
+class PlainReader(PNMReader):
+    # P1-P3 keep the raster as whitespace separated decimal numbers
+
+    def read_raster(self, stream: tp.BinaryIO, meta: PNMMetaData, mmap: bool) -> npt.NDArray:
+        size = meta.height * meta.width * meta.depth
+        tokens = self.split(re.sub(rb"#[^\n]*", b"", stream.read()))
+        assert len(tokens) >= size, "Invalid image size"
+        arr = np.array(tokens[:size]).astype(np.uint8 if meta.maxval < 2 ** 8 else np.uint16)
+        assert arr.max(initial=0) <= meta.maxval, "Sample exceeds maxval"
+        return arr
 
     @staticmethod
-    def read_meta(stream: tp.BinaryIO) -> PNMMetaData:
-        s = stream.readline()
-        assert s.count(b' ') == 1 and s.endswith(b'\n')
+    def split(raster: bytes) -> tp.List[bytes]:
+        return raster.split()
 
-        width, height = s.rstrip(b'\n').decode().split()
-        assert width.isnumeric() and height.isnumeric()
 
-        s = stream.readline().rstrip(b'\n').decode()
-        assert s.isnumeric()
+class P3Reader(PlainReader):
+    depth = 3
 
-        return PNMMetaData(int(height), int(width))
 
+class P2Reader(PlainReader):
+    depth = 1
+
+
+class P1Reader(PlainReader):
+    depth = 1
+    has_maxval = False
+
+    def read_raster(self, stream: tp.BinaryIO, meta: PNMMetaData, mmap: bool) -> npt.NDArray:
+        bits = super().read_raster(stream, meta, mmap)
+        return np.subtract(1, bits, out=bits)
 
-class P5Reader(PNMReader):
     @staticmethod
-    def reshape(metadata, arr: npt.NDArray) -> npt.NDArray:
-        height, width = metadata.height, metadata.width
-        assert arr.size == height * width, "Invalid image size"
-        return arr.reshape((height, width, 1)).repeat(3, axis=2)
+    def split(raster: bytes) -> tp.List[bytes]:
+        # bits need no separators between them
+        return list(re.sub(rb"\s", b"", raster).decode())
 
 
-class P6Reader(PNMReader):
+class P7Reader(PNMReader):
+    # PAM: "KEY value" lines up to ENDHDR, any depth from gray to RGB with alpha
+
+    def read_meta(self, stream: tp.BinaryIO) -> PNMMetaData:
+        fields = dict()
+        while True:
+            line = stream.readline()
+            assert line, "Unexpected end of header"
+            line = line.split(b"#")[0].strip()
+            if not line:
+                continue
+            key, _, value = line.partition(b" ")
+            if key == b"ENDHDR":
+                break
+            fields[key] = value.strip()
+        assert all(fields.get(key, b"").isdigit() for key in (b"WIDTH", b"HEIGHT", b"DEPTH", b"MAXVAL"))
+        depth = int(fields[b"DEPTH"])
+        assert 1 <= depth <= 4, f"Unsupported depth {depth}"
+        return PNMMetaData(int(fields[b"HEIGHT"]), int(fields[b"WIDTH"]), int(fields[b"MAXVAL"]), depth)
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def read_chunk(stream: tp.BinaryIO) -> tp.Tuple[bytes, bytes]:
+    head = stream.read(8)
+    assert len(head) == 8, "Unexpected end of file"
+    length, kind = struct.unpack(">I4s", head)
+    data, crc = stream.read(length), stream.read(4)
+    assert len(data) == length and len(crc) == 4, "Unexpected end of file"
+    assert zlib.crc32(kind + data) == struct.unpack(">I", crc)[0], "Corrupted chunk"
+    return kind, data
+
+
+class PNGReader(ImageReader):
+    # 8 and 16 bit gray and RGB, alpha is dropped; no palettes, low bit depths or interlacing
+    CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+    # complete rows are unfiltered in batches of up to this many, Average and Paeth rows
+    # of a batch go to the "unfilter" kernel together
+    BATCH_ROWS = 256
+
+    def read(self, stream: tp.BinaryIO, mmap: bool = False) -> tp.Tuple[npt.NDArray, int]:
+        try:
+            return self.decode(stream)
+        except (AssertionError, zlib.error, struct.error):
+            raise Exception("Broken file")
+
+    def decode(self, stream: tp.BinaryIO) -> tp.Tuple[npt.NDArray, int]:
+        kind, data = read_chunk(stream)
+        assert kind == b"IHDR"
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data)
+        if bit_depth not in (8, 16) or color_type not in self.CHANNELS or interlace:
+            raise Exception("Unsupported PNG format")
+        channels = self.CHANNELS[color_type]
+        bpp = channels * bit_depth // 8
+        stride = width * bpp
+
+        # IDAT chunks are decompressed as they come, complete rows are unfiltered in batches
+        pixels = np.empty((height, stride), dtype=np.uint8)
+        prev = np.zeros(stride, dtype=np.uint8)
+        decompressor, pending, row = zlib.decompressobj(), bytearray(), 0
+        while True:
+            kind, data = read_chunk(stream)
+            if kind == b"IDAT":
+                pending += decompressor.decompress(data)
+            elif kind != b"IEND":
+                continue
+            final = kind == b"IEND"
+            while row < height and (final or len(pending) >= self.BATCH_ROWS * (stride + 1)):
+                rows = min(len(pending) // (stride + 1), self.BATCH_ROWS, height - row)
+                if rows == 0:
+                    break
+                batch = np.frombuffer(bytes(pending[: rows * (stride + 1)]), dtype=np.uint8)
+                batch = batch.reshape((rows, stride + 1))
+                del pending[: rows * (stride + 1)]
+                self.unfilter_rows(batch[:, 0], batch[:, 1:], prev, bpp, pixels[row: row + rows])
+                prev = pixels[row + rows - 1]
+                row += rows
+            if final:
+                break
+        assert row == height, "Invalid image size"
+
+        dtype = np.uint8 if bit_depth == 8 else np.dtype(">u2")
+        samples = pixels.view(dtype).reshape((height, width, channels))
+        return expand_channels(samples), 2 ** bit_depth - 1
+
+    @staticmethod
+    def unfilter_rows(
+            kinds: npt.NDArray[np.uint8],
+            filtered: npt.NDArray[np.uint8],
+            prev: npt.NDArray,
+            bpp: int,
+            out: npt.NDArray
+    ) -> None:
+        # None, Sub and Up rows take a NumPy operation each; Average and Paeth
+        # depend on the byte before, consecutive rows of them go to the kernel at once
+        row = 0
+        while row < len(kinds):
+            if kinds[row] > 4:
+                raise Exception("Broken file")
+            if kinds[row] < 3:
+                PNGReader.unfilter(kinds[row], filtered[row], prev, bpp, out[row])
+                row += 1
+            else:
+                end = row + 1
+                while end < len(kinds) and kinds[end] in (3, 4):
+                    end += 1
+                kernels.get("unfilter")(kinds[row: end], filtered[row: end], prev, bpp, out[row: end])
+                row = end
+            prev = out[row - 1]
+
     @staticmethod
-    def reshape(metadata, arr: npt.NDArray) -> npt.NDArray:
-        height, width = metadata.height, metadata.width
-        assert arr.size == height * width * 3, "Invalid image size"
-        return arr.reshape((height, width, 3))
+    def unfilter(kind: int, filtered: npt.NDArray[np.uint8], prev: npt.NDArray, bpp: int, out: npt.NDArray) -> None:
+        if kind == 0:
+            out[...] = filtered
+        elif kind == 1:
+            np.cumsum(filtered.reshape((-1, bpp)), axis=0, dtype=np.uint8, out=out.reshape((-1, bpp)))
+        elif kind == 2:
+            np.add(filtered, prev, out=out)
+        else:
+            kernels.get("unfilter")(np.array([kind], dtype=np.uint8), filtered[None], prev, bpp, out[None])
+
+
+READERS: tp.Dict[bytes, tp.Type[ImageReader]] = {
+    PNG_SIGNATURE: PNGReader,
+    b"P1": P1Reader,
+    b"P2": P2Reader,
+    b"P3": P3Reader,
+    b"P4": P4Reader,
+    b"P5": P5Reader,
+    b"P6": P6Reader,
+    b"P7": P7Reader,
+}
 
 
-def match(header: bytes, stream: tp.BinaryIO) -> npt.NDArray:
-    if header == b"P6":
-        return P6Reader().read(stream)
-    if header == b"P5":
-        return P5Reader().read(stream)
+def match(header: bytes, stream: tp.BinaryIO, mmap: bool = False) -> tp.Tuple[npt.NDArray, int]:
+    if header in READERS:
+        return READERS[header]().read(stream, mmap)
     else:
         raise Exception("Unknown image format")
 
 
-def read_image(path: str) -> npt.NDArray:
+def read_image(path: str, mmap: bool = False) -> tp.Tuple[npt.NDArray, int]:
     with open(path, "rb") as stream:
-        header = stream.readline().rstrip(b'\n')
-        return match(header, stream)
+        signature = stream.peek(max(map(len, READERS)))
+        header = next((magic for magic in READERS if signature.startswith(magic)), signature[:2])
+        stream.read(len(header))
+        return match(header, stream, mmap)
@@ -1,7 +1,16 @@
+import struct
+import typing as tp
+import zlib
 from abc import abstractmethod
 from typing import BinaryIO
 import numpy as np
 
+from .reading import sample_dtype, PNG_SIGNATURE
+from .utils import quantize
+
+
+ROWS_PER_CHUNK = 64
+
 
 class ImageSaver:
     @abstractmethod
@@ -9,30 +18,90 @@ class ImageSaver:
         pass
 
     @abstractmethod
-    def save(self, arr: np.ndarray, stream: BinaryIO):
+    def save(self, arr: np.ndarray, stream: BinaryIO, maxval: int = 255, source_maxval: tp.Optional[int] = None):
+        # arr is the working image: floats in [0, 1], or integer samples in [0, source_maxval].
+        # It is converted band by band, so memory use does not grow with the image size.
         pass
 
 
-class P6Saver(ImageSaver):
+class PNMSaver(ImageSaver):
+    magic: bytes
+
+    def save(self, arr: np.ndarray, stream: BinaryIO, maxval: int = 255, source_maxval: tp.Optional[int] = None):
+        stream.write(self.magic + b'\n')
+        stream.write(f"{arr.shape[1]} {arr.shape[0]}\n"
+                     f"{maxval}\n".encode())
+        dtype = sample_dtype(maxval)
+        for start in range(0, arr.shape[0], ROWS_PER_CHUNK):
+            band = self.convert(arr[start: start + ROWS_PER_CHUNK], maxval, source_maxval)
+            stream.write(band.astype(dtype, copy=False).tobytes())
+
+    @staticmethod
+    @abstractmethod
+    def convert(band: np.ndarray, maxval: int, source_maxval: tp.Optional[int]) -> np.ndarray:
+        pass
+
+
+class P6Saver(PNMSaver):
+    magic = b'P6'
+
     def name(self) -> str:
         return "P6"
 
-    def save(self, arr: np.ndarray, stream: BinaryIO):
-        stream.write(b'P6\n')
-        stream.write(f"{arr.shape[1]} {arr.shape[0]}\n"
-                     f"255\n".encode())
-        stream.write(arr.tobytes())
+    @staticmethod
+    def convert(band: np.ndarray, maxval: int, source_maxval: tp.Optional[int]) -> np.ndarray:
+        return quantize(band, maxval, source_maxval)
+
 
+class P5Saver(PNMSaver):
+    magic = b'P5'
 
-class P5Saver(ImageSaver):
     def name(self) -> str:
         return "P5"
 
-    def save(self, arr: np.ndarray, stream: BinaryIO):
-        r, g, b = arr[:, :, 0], arr[:, :, 1], arr[:, :, 2]
-        arr = np.array(0.2989 * r + 0.5870 * g + 0.1140 * b, dtype=np.uint8)
-        b = arr.tobytes()
-        stream.write(b'P5\n')
-        stream.write(f"{arr.shape[1]} {arr.shape[0]}\n"
-                     f"255\n".encode())
-        stream.write(b)
+    @staticmethod
+    def convert(band: np.ndarray, maxval: int, source_maxval: tp.Optional[int]) -> np.ndarray:
+        r, g, b = band[:, :, 0], band[:, :, 1], band[:, :, 2]
+        luma = 0.2989 * r + 0.5870 * g + 0.1140 * b
+        if source_maxval is not None:
+            luma /= source_maxval
+        return quantize(np.clip(luma, 0, 1, out=luma), maxval)
+
+
+class PNGSaver(ImageSaver):
+    # 8 or 16 bit RGB, every row Up-filtered against the previous one
+    def __init__(self, compression: int = 6):
+        assert 0 <= compression <= 9, "Expected compression level from 0 to 9"
+        self.compression = compression
+
+    def name(self) -> str:
+        return f"PNG (compression {self.compression})"
+
+    @staticmethod
+    def write_chunk(stream: BinaryIO, kind: bytes, data: bytes) -> None:
+        stream.write(struct.pack(">I", len(data)) + kind + data)
+        stream.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def save(self, arr: np.ndarray, stream: BinaryIO, maxval: int = 255, source_maxval: tp.Optional[int] = None):
+        assert maxval in (2 ** 8 - 1, 2 ** 16 - 1), "PNG stores 8 or 16 bit samples only"
+        height, width = arr.shape[:2]
+        bit_depth = 8 if maxval < 2 ** 8 else 16
+        stream.write(PNG_SIGNATURE)
+        self.write_chunk(stream, b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, 2, 0, 0, 0))
+
+        dtype = sample_dtype(maxval)
+        compressor = zlib.compressobj(self.compression)
+        prev = np.zeros(width * 3 * dtype.itemsize, dtype=np.uint8)
+        for start in range(0, height, ROWS_PER_CHUNK):
+            band = quantize(arr[start: start + ROWS_PER_CHUNK], maxval, source_maxval)
+            rows = band.astype(dtype, copy=False).reshape((band.shape[0], -1)).view(np.uint8)
+            filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            np.subtract(rows[:1], prev, out=filtered[:1, 1:])
+            np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+            prev = rows[-1]
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                self.write_chunk(stream, b"IDAT", data)
+        self.write_chunk(stream, b"IDAT", compressor.flush())
+        self.write_chunk(stream, b"IEND", b"")
@@ -3,6 +3,11 @@ import numpy as np
 import typing as tp
 import numpy.typing as npt
 
+from . import kernels
+
+# (source columns, their weights) a target column is made of
+Taps = tp.Tuple[tp.Iterable[int], npt.NDArray]
+
 
 class OneDimensionScaler:
     @abstractmethod
@@ -13,6 +18,18 @@ class OneDimensionScaler:
     def scale(self, image: npt.NDArray, width: int, offset: int = 0, **kwargs) -> npt.NDArray:
         pass
 
+    @staticmethod
+    def resample(image: npt.NDArray, targets: tp.Sequence[Taps]) -> npt.NDArray:
+        # One column of the result per target, through the "resample" kernel;
+        # targets with fewer taps than the widest one are padded with zero weights
+        taps = max([1] + [len(coefs) for _, coefs in targets])
+        indices = np.zeros((len(targets), taps), dtype=np.intp)
+        weights = np.zeros((len(targets), taps))
+        for target_index, (neighbors_index, coefs) in enumerate(targets):
+            indices[target_index, :len(coefs)] = neighbors_index
+            weights[target_index, :len(coefs)] = coefs
+        return kernels.get("resample")(image, indices, weights)
+
 
 class Scaler:
     @staticmethod
@@ -49,14 +66,10 @@ class NearestScaler(OneDimensionScaler):
 
         target_positions = np.arange(width) * scale_coefficient - 1 / 2 + scale_coefficient / 2 + offset
 
-        new_image = np.zeros((old_height, width, 3), dtype=image.dtype)
-        for target_index, target_position in enumerate(target_positions):
-            pos, residual = divmod(target_position, 1)
-            # pos, rem = target_position // 1, target_position % 1
-            neighbor_index = pos if residual < .5 else pos + 1
-            neighbor_index = int(np.clip(neighbor_index, 0, old_width - 1))
-            new_image[:, target_index, :] = image[:, neighbor_index, :]
-        return new_image
+        pos, residual = np.divmod(target_positions, 1)
+        neighbor_index = np.where(residual < .5, pos, pos + 1)
+        neighbor_index = np.clip(neighbor_index, 0, old_width - 1).astype(np.intp)
+        return image[:, neighbor_index]
 
 
 class LinearScaler(OneDimensionScaler):
@@ -74,15 +87,14 @@ class LinearScaler(OneDimensionScaler):
         scale_coefficient = old_width / width
         target_positions = np.arange(width) * scale_coefficient + (scale_coefficient - 1) / 2 + offset
 
-        new_image = np.zeros((old_height, width, 3), dtype=image.dtype)
-        for target_index, target_position in enumerate(target_positions):
-            neighbors_index, coefs = self._get_kernel(
+        targets = [
+            self._get_kernel(
                 position=target_position,
                 radius=max(1, scale_coefficient),
                 high=old_width-1)
-            for layer in range(layers):
-                new_image[:, target_index, layer] = image[:, neighbors_index, layer] @ coefs
-        return new_image
+            for target_position in target_positions
+        ]
+        return self.resample(image, targets)
 
 
 class SplineScaler(OneDimensionScaler):
@@ -128,16 +140,15 @@ class SplineScaler(OneDimensionScaler):
         scale_coefficient = old_width / width
         target_positions = np.arange(width) * scale_coefficient + (scale_coefficient - 1) / 2 + offset
 
-        new_image = np.zeros((old_height, width, 3), dtype=image.dtype)
-        for target_index, target_position in enumerate(target_positions):
-            neighbors_index, coefs = self._get_kernel(
+        targets = [
+            self._get_kernel(
                 position=target_position,
                 radius=max(1, scale_coefficient),
                 high=old_width-1,
                 b=b, c=c)
-            for layer in range(layers):
-                new_image[:, target_index, layer] = image[:, neighbors_index, layer] @ coefs
-        return new_image
+            for target_position in target_positions
+        ]
+        return self.resample(image, targets)
 
 
 class LanczosScaler(OneDimensionScaler):
@@ -160,13 +171,12 @@ class LanczosScaler(OneDimensionScaler):
         scale_coefficient = old_width / width
         target_positions = np.arange(width) * scale_coefficient + (scale_coefficient - 1) / 2 + offset
 
-        new_image = np.zeros((old_height, width, 3), dtype=image.dtype)
-        for target_index, target_position in enumerate(target_positions):
-            neighbors_index, coefs = self._get_kernel(
+        targets = [
+            self._get_kernel(
                 position=target_position,
                 radius=max(1, scale_coefficient),
                 high=old_width-1
             )
-            for layer in range(layers):
-                new_image[:, target_index, layer] = image[:, neighbors_index, layer] @ coefs
-        return new_image
+            for target_position in target_positions
+        ]
+        return self.resample(image, targets)
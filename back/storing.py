@@ -1,15 +1,70 @@
+import typing as tp
+
 import numpy as np
 import numpy.typing as npt
 
+from .histograms import Histograms
+from .history import Region
+from .tracing import traced
+from .utils import clip_image, quantize
+
 
 class ImageHolder:
     def __init__(self) -> None:
-        self.image: npt.NDArray = np.array([[[0, 0, 0]]])
+        # data is either a float image in [0, 1] (maxval is None)
+        # or the integer samples in [0, maxval] as they were read
+        self.data: npt.NDArray = np.zeros((1, 1, 3))
+        self.data.flags.writeable = False
+        self.maxval: tp.Optional[int] = None
+        self._image: tp.Optional[npt.NDArray] = self.data
+        self.version: int = 0
+        self.histograms = Histograms(self)
+
+    @property
+    def image(self) -> npt.NDArray:
+        return self.get_image()
+
+    @property
+    def shape(self) -> tp.Tuple[int, ...]:
+        return self.data.shape
+
+    @traced
+    def set_image(
+            self,
+            image: npt.NDArray,
+            in_range: bool = False,
+            maxval: tp.Optional[int] = None,
+            changed: tp.Optional[tp.Sequence[Region]] = None
+    ) -> None:
+        # in_range: the producer guarantees values in [0, 1], so clipping is skipped;
+        # maxval: image holds integer samples, kept as they are and promoted to float on demand;
+        # changed: the only regions where image differs from the current one, if known
+        if maxval is None and not in_range:
+            image = clip_image(image)
+        # The stored image is shared with readers, nobody may change it in place
+        image.flags.writeable = False
+        old, old_maxval = self.data, self.maxval
+        self.data, self.maxval = image, maxval
+        self._image = image if maxval is None else None
+        self.version += 1
+        if changed is not None and old.shape == image.shape:
+            self.histograms.update(old, old_maxval, changed, self.version - 1)
+
+    @traced
+    def get_image(self, copy: bool = False) -> npt.NDArray:
+        # Read-only view by default, callers that mutate ask for their own copy
+        image = self._image
+        if image is None:
+            image = self.data / self.maxval
+            image.flags.writeable = False
+            self._image = image
+        return image.copy() if copy else image
 
-    def set_image(self, image: npt.NDArray, scale: bool = False) -> None:
-        if scale:
-            image = image / 255
-        self.image = np.clip(image, 0, 1)
+    def get_region(self, rows: npt.NDArray[int], cols: npt.NDArray[int]) -> npt.NDArray:
+        # A float copy of the given rows and columns, without promoting the whole image
+        if self._image is not None:
+            return self._image[np.ix_(rows, cols)]
+        return self.data[np.ix_(rows, cols)] / self.maxval
 
-    def get_image(self) -> npt.NDArray:
-        return self.image.copy()
+    def quantize(self, maxval: int = 255) -> npt.NDArray:
+        return quantize(self.data, maxval, self.maxval)
@@ -0,0 +1,41 @@
+import contextlib
+import contextvars
+import typing as tp
+
+
+class CancelledError(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, on_progress: tp.Optional[tp.Callable[[float], None]] = None):
+        self.on_progress = on_progress
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def report(self, done: int, total: int) -> None:
+        if self.cancelled:
+            raise CancelledError("Operation cancelled")
+        if self.on_progress is not None and total > 0:
+            self.on_progress(done / total)
+
+
+_current_task: contextvars.ContextVar[tp.Optional[Task]] = contextvars.ContextVar("current_task", default=None)
+
+
+@contextlib.contextmanager
+def run_task(task: Task) -> tp.Iterator[Task]:
+    token = _current_task.set(task)
+    try:
+        yield task
+    finally:
+        _current_task.reset(token)
+
+
+def report_progress(done: int, total: int) -> None:
+    # Cheap no-op outside of a task, so hot loops may call it on every row
+    task = _current_task.get()
+    if task is not None:
+        task.report(done, total)
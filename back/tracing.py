@@ -0,0 +1,206 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import typing as tp
+
+import numpy as np
+
+# Opt-in spans around the stages of backend work, exported as Chrome trace events
+# (chrome://tracing, ui.perfetto.dev or speedscope). Tracing is process-wide so the
+# spans of background jobs are collected too; when it is off span() returns a shared
+# no-op and traced functions cost one global lookup.
+#
+#     with tracing.session("trace.json"):
+#         backend.filter_image(GaussianFilter(2))
+#
+# Setting TRACE_FILE=trace.json traces the whole process and writes the file at exit
+# ("{pid}" in it is replaced, for the worker processes of batch.py, which write theirs
+# with flush() as pool workers exit without running atexit); TRACE_MEMORY=1 adds the
+# bytes every span allocates.
+
+F = tp.TypeVar("F", bound=tp.Callable[..., tp.Any])
+
+
+def describe(array: np.ndarray) -> tp.Dict[str, tp.Any]:
+    return dict(shape=list(array.shape), dtype=str(array.dtype), bytes=array.nbytes)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "start", "memory")
+
+    def __init__(self, tracer: 'Tracer', name: str, category: str):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args: tp.Dict[str, tp.Any] = dict()
+
+    def annotate(self, **values: tp.Any) -> None:
+        # Arrays are recorded by shape, dtype and size, anything else as it is
+        for key, value in values.items():
+            self.args[key] = describe(value) if isinstance(value, np.ndarray) else value
+
+    def __enter__(self) -> 'Span':
+        if self.tracer.track_memory:
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        end = time.perf_counter_ns()
+        if self.tracer.track_memory:
+            # net bytes still allocated when the stage is over, its result included
+            self.args["allocated"] = tracemalloc.get_traced_memory()[0] - self.memory
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add(self, end)
+
+
+class NoSpan:
+    # What span() returns while tracing is off
+    __slots__ = ()
+
+    def annotate(self, **values: tp.Any) -> None:
+        pass
+
+    def __enter__(self) -> 'NoSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+class Tracer:
+    def __init__(self, track_memory: bool = False):
+        # track_memory runs tracemalloc to record the bytes every span allocates,
+        # which makes Python-level loops several times slower
+        self.track_memory = track_memory
+        self.events: tp.List[tp.Dict[str, tp.Any]] = list()
+        self._origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span, end: int) -> None:
+        event = dict(
+            name=span.name, cat=span.category, ph="X",
+            ts=(span.start - self._origin) / 1000, dur=(end - span.start) / 1000,
+            pid=os.getpid(), tid=threading.get_ident(), args=span.args
+        )
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> tp.Dict[str, tp.Tuple[int, float]]:
+        # name -> (count, total milliseconds); a nested span's time is part of its parent's as well
+        totals: tp.Dict[str, tp.Tuple[int, float]] = dict()
+        with self._lock:
+            for event in self.events:
+                count, total = totals.get(event["name"], (0, 0.0))
+                totals[event["name"]] = (count + 1, total + event["dur"] / 1000)
+        return totals
+
+    def to_chrome(self) -> tp.Dict[str, tp.Any]:
+        with self._lock:
+            events = list(self.events)
+        threads = sorted({event["tid"] for event in events})
+        names = [
+            dict(name="thread_name", ph="M", pid=os.getpid(), tid=tid, args=dict(name=f"thread {index}"))
+            for index, tid in enumerate(threads)
+        ]
+        return dict(traceEvents=names + events, displayTimeUnit="ms")
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as stream:
+            json.dump(self.to_chrome(), stream)
+
+
+_tracer: tp.Optional[Tracer] = None
+# tracemalloc is only stopped again if tracing started it
+_owns_tracemalloc = False
+# TRACE_FILE when the whole process is traced
+_trace_path: tp.Optional[str] = None
+
+
+def start(track_memory: bool = False) -> Tracer:
+    global _tracer, _owns_tracemalloc
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _owns_tracemalloc = True
+    _tracer = Tracer(track_memory)
+    return _tracer
+
+
+def stop() -> tp.Optional[Tracer]:
+    global _tracer, _owns_tracemalloc
+    tracer, _tracer = _tracer, None
+    if _owns_tracemalloc:
+        tracemalloc.stop()
+        _owns_tracemalloc = False
+    return tracer
+
+
+@contextlib.contextmanager
+def session(path: tp.Optional[str] = None, track_memory: bool = False) -> tp.Iterator[Tracer]:
+    # Traces the block and writes the trace to path when given
+    tracer = start(track_memory)
+    try:
+        yield tracer
+    finally:
+        stop()
+        if path is not None:
+            tracer.save(path)
+
+
+def span(name: str, category: str = "stage", **values: tp.Any) -> tp.Union[Span, NoSpan]:
+    tracer = _tracer
+    if tracer is None:
+        return NO_SPAN
+    new_span = Span(tracer, name, category)
+    new_span.annotate(**values)
+    return new_span
+
+
+def traced(function: F) -> F:
+    # A span named after the function around every call
+    name = function.__qualname__
+    category = function.__module__.rpartition(".")[2]
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return function(*args, **kwargs)
+        with Span(tracer, name, category):
+            return function(*args, **kwargs)
+    return tp.cast(F, wrapper)
+
+
+def flush() -> None:
+    # Writes the events so far to TRACE_FILE when the whole process is traced
+    tracer = _tracer
+    if tracer is not None and _trace_path is not None:
+        tracer.save(_trace_path.format(pid=os.getpid()))
+
+
+def _trace_process(path: str) -> None:
+    global _trace_path
+    _trace_path = path
+    track_memory = bool(os.environ.get("TRACE_MEMORY"))
+    start(track_memory)
+
+    def save() -> None:
+        flush()
+        stop()
+    atexit.register(save)
+    # forked workers start with a trace of their own instead of a copy of the parent's events
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: start(track_memory))
+
+
+if os.environ.get("TRACE_FILE"):
+    _trace_process(os.environ["TRACE_FILE"])
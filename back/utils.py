@@ -1,3 +1,5 @@
+import typing as tp
+
 import numpy as np
 import numpy.typing as npt
 
@@ -22,16 +24,50 @@ def convert_gamma(image: npt.NDArray, from_: float = 0.0, to_: float = 0.0):
     if stored_in_srgb:
         if stored_to_srgb:
             return image
-        image = _srgb_to_linear(image)
+        image = _srgb_to_linear(image if image.flags.writeable else image.copy())
     elif from_ != 1.0:
         image = image ** (1/from_)
     if stored_to_srgb:
-        image = _linear_to_srgb(image)
+        image = _linear_to_srgb(image if image.flags.writeable else image.copy())
     elif to_ != 1.0:
         image = image ** to_
     return image
 
 
+def clip_image(image: npt.NDArray) -> npt.NDArray:
+    # Clip to [0, 1], in place when the array is ours to change
+    if image.flags.writeable and image.dtype.kind == "f":
+        return np.clip(image, 0, 1, out=image)
+    return np.clip(image, 0, 1)
+
+
+def image_bytes(height: int, width: int) -> int:
+    # Size of a float RGB image, the form operations compute in
+    return height * width * 3 * np.dtype(np.float64).itemsize
+
+
+def quantize(image: npt.NDArray, maxval: int, source_maxval: tp.Optional[int] = None) -> npt.NDArray:
+    # Integer samples in [0, maxval] (uint8 up to 255, uint16 above) from a float image
+    # in [0, 1] or from integer samples relative to source_maxval
+    dtype = np.uint8 if maxval < 2 ** 8 else np.uint16
+    if source_maxval == maxval:
+        return image
+    if source_maxval is not None:
+        return ((image.astype(np.uint32) * maxval + source_maxval // 2) // source_maxval).astype(dtype)
+    view = image * maxval
+    return np.round(view, out=view).astype(dtype)
+
+
+def downscale(image: npt.NDArray, max_size: int) -> npt.NDArray:
+    height, width, depth = image.shape
+    factor = int(np.ceil(max(height, width) / max_size))
+    if factor <= 1:
+        return image
+    height, width = height // factor * factor, width // factor * factor
+    blocks = image[:height, :width].reshape(height // factor, factor, width // factor, factor, depth)
+    return blocks.mean(axis=(1, 3))
+
+
 # <-- LAB 5 -->
 def draw_gradient(height: int, width: int) -> npt.NDArray:
     gradient = np.linspace(0, 1, width) \
@@ -0,0 +1,72 @@
+"""Checks that operations run in bands of rows give the whole-image result.
+
+MemoryGuard runs an operation over its working memory budget in bands of rows
+(back/memory.py). This script runs every operation that supports bands, fused
+chains included, both ways on a seeded image whose height is not a multiple of
+the band heights. It fails when any banded result differs from the whole-image one.
+
+    python benchmarks/bands.py [--height 203] [--width 150]
+"""
+import argparse
+import os
+import sys
+import typing as tp
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from back.colorspace import HSLSpace, RGBSpace, YCbCr601Space  # noqa: E402
+from back.dithering import AtkinsonDitherer, OrderedDitherer  # noqa: E402
+from back.filtering import BoxBlurFilter, GaussianFilter, MedianFilter, SobelFilter, ThresholdFilter, \
+    UnsharpMaskingFilter  # noqa: E402
+from back.memory import BAND_ALIGNMENT, run_in_bands  # noqa: E402
+from back.operations import ColorSpaceOperation, DitherOperation, FilterOperation, ImageState, LinearChain, \
+    Operation, StoreGammaOperation  # noqa: E402
+
+BAND_HEIGHTS = (BAND_ALIGNMENT, 3 * BAND_ALIGNMENT, 8 * BAND_ALIGNMENT)
+
+
+def operations() -> tp.List[Operation]:
+    box_then_ordered = LinearChain([FilterOperation(BoxBlurFilter(1)), DitherOperation(OrderedDitherer(), 2)])
+    return [
+        FilterOperation(BoxBlurFilter(2)),
+        FilterOperation(GaussianFilter(1.5)),
+        FilterOperation(MedianFilter(1)),
+        FilterOperation(SobelFilter()),
+        FilterOperation(ThresholdFilter(0.3, 0.6)),
+        FilterOperation(UnsharpMaskingFilter(1.0, 1.0)),
+        DitherOperation(OrderedDitherer(), 2),
+        StoreGammaOperation(2.2),
+        ColorSpaceOperation(HSLSpace()),
+        ColorSpaceOperation(YCbCr601Space(), convert=False),
+        box_then_ordered,
+        LinearChain([FilterOperation(GaussianFilter(1.0)), FilterOperation(SobelFilter()), box_then_ordered]),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--height", type=int, default=203)
+    parser.add_argument("--width", type=int, default=150)
+    args = parser.parse_args()
+
+    image = np.random.default_rng(0).random((args.height, args.width, 3))
+    image.flags.writeable = False
+    state = ImageState(image, RGBSpace(), 1.0)
+    failures = 0
+    for operation in operations():
+        assert operation.halo() is not None, f"{operation.describe()} does not run in bands"
+        whole = operation.run(state).image
+        for rows in BAND_HEIGHTS:
+            difference = np.abs(run_in_bands(operation, state, rows).image - whole).max()
+            failures += difference != 0
+            status = "ok" if difference == 0 else "DIFFERS"
+            print(f"{operation.describe():<70} {rows:>3} rows  max difference {difference:.3g}  {status}")
+    print(f"{failures} banded runs differ from the whole image")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Guards the import of the headless backend against regressions.
+
+Runs ``python -X importtime -c "import back"`` in a fresh interpreter, prints the
+slowest modules and fails when the total exceeds the budget or when a GUI
+module (PyQt6, matplotlib) or numba, which back/kernels.py loads on first use,
+gets imported along the way.
+
+    python benchmarks/import_time.py [--budget-ms 400] [--module back] [--repeat 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import typing as tp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN = ("PyQt6", "matplotlib", "numba")
+
+
+def measure(module: str) -> tp.List[tp.Tuple[str, int, int]]:
+    # (module, self us, cumulative us) for every module the import pulls in
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    rows = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="back")
+    parser.add_argument("--budget-ms", type=float, default=400.0)
+    parser.add_argument("--repeat", type=int, default=5, help="the best of this many runs is compared")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(max(1, args.repeat))]
+    totals = [next(cumulative for name, _, cumulative in rows if name == args.module) for rows in runs]
+    best = min(range(len(runs)), key=totals.__getitem__)
+    rows, total_ms = runs[best], totals[best] / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {len(runs)}), budget {args.budget_ms:.0f} ms")
+    for name, self_us, _ in sorted(rows, key=lambda row: -row[1])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    forbidden = sorted({name.split(".")[0] for name, _, _ in rows} & set(FORBIDDEN))
+    if forbidden:
+        print(f"FAIL: import {args.module} pulls in {', '.join(forbidden)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import {args.module} took {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
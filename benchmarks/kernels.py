@@ -0,0 +1,40 @@
+"""Checks and times every implementation of the backend's kernels.
+
+Runs each implementation registered in back/kernels.py (the NumPy reference and,
+when numba is installed, the compiled ones) on the same seeded inputs, prints how
+long each took and fails when any result differs from the reference's. It also
+shows which implementation the backend picks; BACK_KERNELS changes that choice:
+
+    python benchmarks/kernels.py [--seed 0]
+    BACK_KERNELS=numpy python benchmarks/kernels.py
+    BACK_KERNELS=error_diffusion=numba,median=numpy python benchmarks/kernels.py
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from back import kernels  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    checks = kernels.self_test(args.seed)
+    for check in checks:
+        status = "ok" if check.matches else "DIFFERS"
+        print(f"{check.kernel:<16} {check.implementation:<8} {check.milliseconds:9.2f} ms  "
+              f"max difference {check.difference:.3g}  {status}")
+    for kernel in sorted({check.kernel for check in checks}):
+        print(f"{kernel}: using {kernels.choose(kernel)} of {', '.join(kernels.implementations(kernel))}")
+    failures = [check for check in checks if not check.matches]
+    print(f"{len(failures)} implementations differ from {kernels.REFERENCE}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
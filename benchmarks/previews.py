@@ -0,0 +1,69 @@
+"""Checks that quick previews leave the shared proxy as it was.
+
+Backend caches one downscaled proxy of the image for every quick preview. This
+script runs each kind of preview twice in a row, for several colorspaces and
+store gammas. It fails when the second preview differs from the first, or when
+the proxy changed along the way.
+
+    python benchmarks/previews.py [--size 600]
+"""
+import argparse
+import os
+import sys
+import typing as tp
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from back import Backend  # noqa: E402
+from back.colorspace import ColorSpace, HSLSpace, RGBSpace, YCbCr601Space  # noqa: E402
+from back.filtering import BoxBlurFilter, GaussianFilter, MedianFilter, SobelFilter  # noqa: E402
+from back.scaling import LanczosScaler, NearestScaler  # noqa: E402
+
+GAMMAS = (0.0, 1.0, 2.2)
+COLORSPACES: tp.Tuple[ColorSpace, ...] = (RGBSpace(), HSLSpace(), YCbCr601Space())
+
+
+def previews(backend: Backend) -> tp.List[tp.Tuple[str, tp.Callable[[], None]]]:
+    height, width = backend.get_size()
+    return [
+        ("Box Blur", lambda: backend.preview_filter(BoxBlurFilter(1))),
+        ("Gaussian Blur", lambda: backend.preview_filter(GaussianFilter(2.0))),
+        ("Median Filter", lambda: backend.preview_filter(MedianFilter(1))),
+        ("Sobel", lambda: backend.preview_filter(SobelFilter())),
+        ("Scale Nearest", lambda: backend.preview_scale(NearestScaler(), height // 2, width // 2, 0, 0)),
+        ("Scale Lanczos3", lambda: backend.preview_scale(LanczosScaler(), height * 2, width * 2, 0, 0)),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=600)
+    args = parser.parse_args()
+
+    failures = 0
+    for colorspace in COLORSPACES:
+        for gamma in GAMMAS:
+            backend = Backend()
+            backend.draw_gradient(args.size, args.size)
+            backend.change_store_gamma(gamma)
+            backend.change_colorspace(colorspace)
+            for name, preview in previews(backend):
+                proxy = backend.get_proxy()[0].copy()
+                preview()
+                first = backend.preview.state.image
+                preview()
+                second = backend.preview.state.image
+                same = np.array_equal(first, second) and np.array_equal(proxy, backend.get_proxy()[0])
+                failures += not same
+                label = f"{name} in {colorspace.name()} with gamma {gamma:g}"
+                print(f"{label:<45} {'ok' if same else 'CHANGED'}")
+                backend.clear_preview()
+    print(f"{failures} previews changed the proxy")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Measures how long the GUI takes to start.
+
+Imports ``main`` (which builds the QApplication and the main window, without
+entering the event loop) in a fresh interpreter on the offscreen Qt platform,
+and fails when the best run exceeds the budget or when matplotlib, which only
+the autocorrection window needs, gets imported at startup.
+
+    python benchmarks/startup_time.py [--budget-ms 600] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import typing as tp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY = ("matplotlib",)
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted({name.split(".")[0] for name in sys.modules})}))
+"""
+
+
+def measure() -> tp.Dict[str, tp.Any]:
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=600.0)
+    parser.add_argument("--repeat", type=int, default=5, help="the best of this many runs is compared")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(max(1, args.repeat))]
+    best_ms = min(run["seconds"] for run in runs) * 1000
+    print(f"import main: {best_ms:.1f} ms (best of {len(runs)}), budget {args.budget_ms:.0f} ms")
+
+    failed = False
+    eager = sorted(set(runs[0]["modules"]) & set(LAZY))
+    if eager:
+        print(f"FAIL: {', '.join(eager)} imported at startup")
+        failed = True
+    if best_ms > args.budget_ms:
+        print(f"FAIL: startup took {best_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Measures the speed and memory use of every image operation in the backend.
+
+Every concrete Filter, OneDimensionScaler (through Scaler), ImageDitherer,
+ColorSpace conversion, reader and saver runs on synthetic images of each size.
+The script records throughput in megapixels per second (of the input image) and
+the tracemalloc peak of a separate run. Results are written as JSON. The compare
+mode flags cases that got slower, or that use more memory, than a baseline by more
+than the threshold.
+
+    python benchmarks/throughput.py run [--sizes 256,1k] [-k Gaussian] [-o results.json] [--baseline base.json]
+    python benchmarks/throughput.py compare base.json results.json [--threshold 0.1]
+
+Sizes are 256, 512, 1k, 2k (squares), 4k (3840x2160) and 8k (7680x4320). Some
+cases are slow without the numba kernels (see back/kernels.py and BACK_KERNELS),
+so a case is skipped at the larger sizes once it has taken more than --max-seconds.
+"""
+import argparse
+import datetime
+import gc
+import inspect
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as tp
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from back import colorspace, dithering, filtering, scaling  # noqa: E402
+from back.reading import read_image  # noqa: E402
+from back.saving import ImageSaver, P5Saver, P6Saver, PNGSaver  # noqa: E402
+
+SIZES: tp.Dict[str, tp.Tuple[int, int]] = {
+    "256": (256, 256),
+    "512": (512, 512),
+    "1k": (1024, 1024),
+    "2k": (2048, 2048),
+    "4k": (2160, 3840),
+    "8k": (4320, 7680),
+}
+DEFAULT_SIZES = "256,512,1k"
+MIN_SECONDS = 0.2
+MAX_RUNS = 100
+# Catmull-Rom for the spline scaler, the others ignore these
+SCALER_PARAMS = dict(b=0.0, c=0.5)
+SAVERS: tp.Tuple[ImageSaver, ...] = (P5Saver(), P6Saver(), PNGSaver(1), PNGSaver(6))
+
+# (kind, name, prepare, run): prepare builds the input once and is not timed, run gets a fresh copy of it
+Case = tp.Tuple[str, str, tp.Callable[[np.ndarray], tp.Any], tp.Callable[[tp.Any], tp.Any]]
+
+
+def synthetic_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    # Smooth gradients plus some noise, so filters, encoders and histograms see realistic data
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height)[:, None, None]
+    x = np.linspace(0, 1, width)[None, :, None]
+    phase = np.array([0.0, 2.0, 4.0])
+    image = 0.5 + 0.35 * np.sin(6 * x + 4 * y + phase) * np.cos(5 * y - phase)
+    image = image + rng.normal(0, 0.03, (height, width, 3))
+    return np.clip(image, 0, 1)
+
+
+def implementations(module, base: type) -> tp.List[tp.Any]:
+    # Instances of every class of the module that implements base, placeholders without a name are left out
+    found = list()
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if not issubclass(cls, base) or cls is base or cls.__module__ != module.__name__:
+            continue
+        try:
+            instance = cls()
+        except TypeError:
+            continue
+        if isinstance(instance.name(), str):
+            found.append(instance)
+    return found
+
+
+def identity(image: np.ndarray) -> np.ndarray:
+    return image
+
+
+def encoded(saver: ImageSaver) -> tp.Callable[[np.ndarray], str]:
+    def prepare(image: np.ndarray) -> str:
+        fd, path = tempfile.mkstemp(suffix=".bin")
+        with os.fdopen(fd, "wb") as stream:
+            saver.save(image, stream)
+        return path
+    return prepare
+
+
+def build_cases(scale: float) -> tp.List[Case]:
+    cases: tp.List[Case] = list()
+    for image_filter in implementations(filtering, filtering.Filter):
+        cases.append(("filter", image_filter.name(), identity, image_filter.apply_to))
+    for scaler in implementations(scaling, scaling.OneDimensionScaler):
+        cases.append(("scaler", scaler.name(), identity, lambda image, scaler=scaler: scaling.Scaler.scale(
+            scaler, image, round(image.shape[0] * scale), round(image.shape[1] * scale), **SCALER_PARAMS
+        )))
+    for ditherer in implementations(dithering, dithering.ImageDitherer):
+        cases.append(("ditherer", ditherer.name(), identity, lambda image, ditherer=ditherer: ditherer.dither(
+            image, 1
+        )))
+    for space in implementations(colorspace, colorspace.ColorSpace):
+        cases.append(("colorspace", f"{space.name()} from RGB", identity, space.from_rgb))
+        cases.append(("colorspace", f"{space.name()} to RGB", space.from_rgb, space.to_rgb))
+    for saver in SAVERS:
+        cases.append(("writer", saver.name(), identity, lambda image, saver=saver: saver.save(image, io.BytesIO())))
+        if saver.name() != PNGSaver(1).name():
+            cases.append(("reader", saver.name(), encoded(saver), read_image))
+    return cases
+
+
+def fresh(data: tp.Any) -> tp.Any:
+    # Operations may work in place, every run gets its own input
+    return data.copy() if isinstance(data, np.ndarray) else data
+
+
+def time_case(run: tp.Callable[[tp.Any], tp.Any], data: tp.Any, repeat: int, max_seconds: float) -> float:
+    # Best of at least repeat runs, fast cases keep going for MIN_SECONDS so their timings are not just noise
+    best, total, runs = float("inf"), 0.0, 0
+    while runs < repeat or (total < MIN_SECONDS and runs < MAX_RUNS):
+        data_copy = fresh(data)
+        start = time.perf_counter()
+        run(data_copy)
+        elapsed = time.perf_counter() - start
+        best, total, runs = min(best, elapsed), total + elapsed, runs + 1
+        if best > max_seconds:
+            break
+    return best
+
+
+def peak_memory(run: tp.Callable[[tp.Any], tp.Any], data: tp.Any) -> int:
+    # Bytes allocated on top of the input at the highest point of a run
+    data_copy = fresh(data)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(data_copy)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(args: argparse.Namespace) -> tp.Dict[str, tp.Any]:
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        raise SystemExit(f"unknown sizes {unknown}, expected some of {list(SIZES)}")
+    cases = [case for case in build_cases(args.scale) if any(
+        pattern.lower() in f"{case[0]}/{case[1]}".lower() for pattern in args.select or [""]
+    )]
+
+    results, too_slow = list(), set()
+    for size in sizes:
+        height, width = SIZES[size]
+        image = synthetic_image(height, width)
+        megapixels = height * width / 1e6
+        for kind, name, prepare, run in cases:
+            key = f"{kind}/{name}"
+            result = dict(case=key, size=size, height=height, width=width)
+            results.append(result)
+            if key in too_slow:
+                result["skipped"] = f"took over {args.max_seconds:g}s at a smaller size"
+                print(f"{key:<40} {size:>4}  skipped")
+                continue
+            data = prepare(image)
+            try:
+                seconds = time_case(run, data, args.repeat, args.max_seconds)
+                result.update(seconds=seconds, mpx_per_s=megapixels / seconds)
+                if not args.no_memory:
+                    result["peak_bytes"] = peak_memory(run, data)
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                print(f"{key:<40} {size:>4}  {result['error']}")
+                continue
+            finally:
+                if isinstance(data, str):
+                    os.remove(data)
+            if seconds > args.max_seconds:
+                too_slow.add(key)
+            memory = f"{result['peak_bytes'] / 2 ** 20:9.1f} MiB" if "peak_bytes" in result else ""
+            print(f"{key:<40} {size:>4}  {seconds * 1000:10.1f} ms  {result['mpx_per_s']:9.2f} MP/s  {memory}")
+
+    return dict(
+        meta=dict(
+            date=datetime.datetime.now().isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            processor=platform.processor(),
+            cpus=os.cpu_count(),
+            repeat=args.repeat,
+            scale=args.scale,
+        ),
+        results=results,
+    )
+
+
+def compare(baseline: tp.Dict[str, tp.Any], current: tp.Dict[str, tp.Any], threshold: float) -> tp.List[str]:
+    # Cases measured in both runs that lost more than threshold of their throughput or grew their peak memory
+    before = {(result["case"], result["size"]): result for result in baseline["results"]}
+    regressions = list()
+    for result in current["results"]:
+        old = before.get((result["case"], result["size"]))
+        if old is None:
+            continue
+        label = f"{result['case']} @ {result['size']}"
+        if "error" in result and "error" not in old:
+            regressions.append(f"{label}: now fails with {result['error']}")
+        if "mpx_per_s" in result and "mpx_per_s" in old and result["mpx_per_s"] < old["mpx_per_s"] * (1 - threshold):
+            regressions.append(
+                f"{label}: {old['mpx_per_s']:.2f} -> {result['mpx_per_s']:.2f} MP/s "
+                f"({result['mpx_per_s'] / old['mpx_per_s'] - 1:+.0%})"
+            )
+        if "peak_bytes" in result and "peak_bytes" in old and result["peak_bytes"] > old["peak_bytes"] * (1 + threshold):
+            regressions.append(
+                f"{label}: peak memory {old['peak_bytes'] / 2 ** 20:.1f} -> {result['peak_bytes'] / 2 ** 20:.1f} MiB"
+            )
+    return regressions
+
+
+def report(regressions: tp.List[str], threshold: float) -> int:
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regressions beyond {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def load(path: str) -> tp.Dict[str, tp.Any]:
+    with open(path) as stream:
+        return json.load(stream)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma separated, from {', '.join(SIZES)}")
+    run.add_argument("-k", dest="select", action="append", help="only cases containing this text, repeatable")
+    run.add_argument("--repeat", type=int, default=3, help="the best of this many runs is reported")
+    run.add_argument("--scale", type=float, default=2.0, help="factor the scalers resize by")
+    run.add_argument("--max-seconds", type=float, default=10.0, help="skip larger sizes of slower cases")
+    run.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    run.add_argument("-o", "--output", help="write the results to this JSON file")
+    run.add_argument("--baseline", help="compare the results against this JSON file")
+    run.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+
+    check = commands.add_parser("compare", help="compare two result files")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=0.1, help="allowed relative slowdown")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        return report(compare(load(args.baseline), load(args.current), args.threshold), args.threshold)
+
+    args.repeat = max(1, args.repeat)
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(results, stream, indent=2)
+    if args.baseline:
+        return report(compare(load(args.baseline), results, args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,31 @@
-import matplotlib
 import typing as tp
 
-from PyQt6.QtWidgets import QMenu, QLineEdit, QLabel
+from PyQt6.QtWidgets import QLineEdit, QLabel, QPushButton
 
 from back import Backend
 from front.controller import Controller
 from front.image_view import ImageView
-
-
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-from matplotlib.figure import Figure
-
-matplotlib.use('QtAgg')
-
-
-class MplCanvas(FigureCanvasQTAgg):
-
-    def __init__(self, width=5, height=15, dpi=100):
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self.red_axes = fig.add_subplot(311)
-        self.green_axes = fig.add_subplot(312)
-        self.blue_axes = fig.add_subplot(313)
-        super(MplCanvas, self).__init__(fig)
+from front.job_executor import JobExecutor
 
 
 class AutocorrectionController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView):
-        super().__init__(title, backend, image_view)
+    def __init__(self, title: str, backend: Backend, image_view: ImageView, executor: JobExecutor):
+        super().__init__(title, backend, image_view, executor)
 
+        # matplotlib takes longer to import than the rest of the GUI, only load it once it is needed
+        from front.histogram_canvas import MplCanvas
         self.histograms_view = MplCanvas()
         self.alpha = QLineEdit()
         self.add_widget(self.histograms_view).add_widget(QLabel("Alpha:")).add_widget(self.alpha)
-
         self.attach_button()
+
+        self.clip_limit = QLineEdit("2.0")
+        self.tiles = QLineEdit("8")
+        self.clahe_button = QPushButton("CLAHE")
+        self.clahe_button.clicked.connect(self.accept_clahe)
+        self.add_widget(QLabel("Clip limit:")).add_widget(self.clip_limit)
+        self.add_widget(QLabel("Tiles:")).add_widget(self.tiles).add_widget(self.clahe_button)
         self.build()
-        self.attach_action(menu)
 
     def build_histograms(self):
         hists = self.backend.get_histograms()
@@ -57,7 +48,19 @@ class AutocorrectionController(Controller):
         except ValueError:
             raise Exception("Expected float value with dot separator")
         assert 0 <= alpha < 0.5, "Expected alpha value from [0;0.5)"
-        self.backend.autocorrect(alpha)
+        self.run_operation(lambda: self.backend.autocorrect(alpha), on_finished=self.on_corrected)
+
+    def accept_clahe(self):
+        try:
+            clip_limit = float(self.clip_limit.text())
+            tiles = int(self.tiles.text())
+        except ValueError:
+            raise Exception("Expected float clip limit and integer tile count")
+        assert clip_limit >= 1, "Expected clip limit of at least 1"
+        assert tiles >= 1, "Expected at least one tile"
+        self.run_operation(lambda: self.backend.clahe(clip_limit, tiles), on_finished=self.on_corrected)
+
+    def on_corrected(self):
         self.build_histograms()
         self.update_image_view()
 
@@ -1,6 +1,6 @@
 from typing import List
 
-from PyQt6.QtWidgets import QCheckBox, QMenu, QComboBox
+from PyQt6.QtWidgets import QCheckBox, QComboBox
 
 from back import ColorSpace, Backend
 from front.controller import Controller
@@ -8,7 +8,7 @@ from front.image_view import ImageView
 
 
 class ColorSpaceController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView, spaces: List[ColorSpace]):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView, spaces: List[ColorSpace]):
         super().__init__(title, backend, image_view)
         self.setMinimumSize(300, 100)
         self.backend = backend
@@ -21,7 +21,6 @@ class ColorSpaceController(Controller):
 
         self.add_hor_layout().add_widget(self.checkbox).add_widget(self.combobox).build_layout()
         self.attach_button().build()
-        self.attach_action(menu)
 
     def accept(self):
         enabled = self.checkbox.isChecked()
@@ -1,18 +1,21 @@
+import typing as tp
 from abc import ABC, abstractmethod
 
 from PyQt6.QtWidgets import QPushButton
 
 from back import Backend
 from front.image_view import ImageView
+from front.job_executor import JobExecutor
 from front.widget_controller import WidgetController
 
 
 class Controller(WidgetController):
-    def __init__(self, title: str, backend: Backend, image_view: ImageView):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView, executor: tp.Optional[JobExecutor] = None):
         super().__init__(title)
         self.button = QPushButton("Ok")
         self.backend = backend
         self.image_view = image_view
+        self.executor = executor
 
     @abstractmethod
     def accept(self):
@@ -24,6 +27,17 @@ class Controller(WidgetController):
 
         return self
 
+    def run_operation(
+            self,
+            operation: tp.Callable[[], None],
+            on_finished: tp.Optional[tp.Callable[[], None]] = None
+    ) -> None:
+        on_finished = on_finished or self.update_image_view
+        if self.executor is None:
+            operation()
+            on_finished()
+            return
+        self.executor.submit(self.title, operation, on_finished=on_finished)
+
     def update_image_view(self):
-        pixmap = self.backend.get_view()
-        self.image_view.set_image(pixmap)
+        self.image_view.refresh()
@@ -1,16 +1,24 @@
 from typing import List
 
 from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QSlider, QMenu, QComboBox, QLabel
+from PyQt6.QtWidgets import QSlider, QComboBox, QLabel
 
 from back import Backend, ImageDitherer
 from front.controller import Controller
 from front.image_view import ImageView
+from front.job_executor import JobExecutor
 
 
 class DitheringController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView, ditherers: List[ImageDitherer]):
-        super().__init__(title, backend, image_view)
+    def __init__(
+            self,
+            title: str,
+            backend: Backend,
+            image_view: ImageView,
+            ditherers: List[ImageDitherer],
+            executor: JobExecutor
+    ):
+        super().__init__(title, backend, image_view, executor)
         self.setMinimumSize(300, 100)
         self.backend = backend
 
@@ -27,7 +35,6 @@ class DitheringController(Controller):
 
         self.add_hor_layout().add_widget(self.label).add_widget(self.slider).add_widget(self.combobox).build_layout()
         self.attach_button().build()
-        self.attach_action(menu)
 
     def update_label(self, value) -> None:
         self.label.setText(str(value))
@@ -36,5 +43,4 @@ class DitheringController(Controller):
         n_bits = self.slider.value()
         ditherer = self.ditherers[self.combobox.currentIndex()]
 
-        self.backend.dither(ditherer, n_bits)
-        self.update_image_view()
+        self.run_operation(lambda: self.backend.dither(ditherer, n_bits))
@@ -0,0 +1,72 @@
+import typing as tp
+
+from PyQt6.QtWidgets import QListWidget, QLineEdit, QLabel, QPushButton, QFormLayout, QWidget
+
+from back import Backend
+from front.controller import Controller
+from front.image_view import ImageView
+from front.job_executor import JobExecutor
+
+
+def _parse(text: str, default: tp.Any) -> tp.Any:
+    if isinstance(default, bool):
+        return text.strip().lower() in ("1", "true", "yes")
+    return type(default)(text)
+
+
+class EditStackController(Controller):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView, executor: JobExecutor):
+        super().__init__(title, backend, image_view, executor)
+        self.setMinimumSize(300, 300)
+
+        self.operations = QListWidget()
+        self.operations.currentRowChanged.connect(self.show_params)
+        self.params_widget = QWidget()
+        self.params_layout = QFormLayout(self.params_widget)
+        self.fields: tp.Dict[str, QLineEdit] = dict()
+        self.defaults: tp.Dict[str, tp.Any] = dict()
+        self.remove_button = QPushButton("Remove")
+        self.remove_button.clicked.connect(self.remove)
+        self.button = QPushButton("Apply")
+
+        self.add_widget(QLabel("Operations:")).add_widget(self.operations).add_widget(self.params_widget)
+        self.add_hor_layout().add_widget(self.remove_button).add_widget(self.button).build_layout()
+        self.button.clicked.connect(self.accept)
+        self.build()
+
+    def fill_operations(self):
+        self.operations.clear()
+        self.operations.addItems([operation.describe() for operation in self.backend.get_operations()])
+
+    def show_params(self, index: int):
+        while self.params_layout.rowCount():
+            self.params_layout.removeRow(0)
+        self.fields.clear()
+        operations = self.backend.get_operations()
+        if not 0 <= index < len(operations):
+            return
+        self.defaults = operations[index].params()
+        for name, value in self.defaults.items():
+            self.fields[name] = QLineEdit(str(value))
+            self.params_layout.addRow(name, self.fields[name])
+
+    def accept(self):
+        index = self.operations.currentRow()
+        if index < 0:
+            return
+        params = {name: _parse(field.text(), self.defaults[name]) for name, field in self.fields.items()}
+        self.run_operation(lambda: self.backend.edit_operation(index, **params))
+
+    def remove(self):
+        index = self.operations.currentRow()
+        if index < 0:
+            return
+        self.run_operation(lambda: self.backend.remove_operation(index))
+
+    def update_image_view(self):
+        super().update_image_view()
+        self.fill_operations()
+
+    def show(self):
+        self.fill_operations()
+        super().show()
@@ -1,25 +1,26 @@
 from typing import List
 
-from PyQt6.QtWidgets import QPushButton, QLineEdit, QLabel, QMenu
+from PyQt6.QtWidgets import QPushButton, QLineEdit, QLabel
 
 from back import Backend
-from front.controller import Controller
+from front.preview_controller import PreviewController
 from front.image_view import ImageView
+from front.job_executor import JobExecutor
 
 
 from inspect import signature
 
 
-class FilterController(Controller):
+class FilterController(PreviewController):
     def __init__(
             self,
             title: str,
-            menu: QMenu,
             backend: Backend,
             image_view: ImageView,
-            image_filter: type
+            image_filter: type,
+            executor: JobExecutor
     ):
-        super().__init__(title, backend, image_view)
+        super().__init__(title, backend, image_view, executor)
 
         self.button = QPushButton("Ok")
         self.image_filter = image_filter
@@ -35,15 +36,18 @@ class FilterController(Controller):
             self.fields.append(field)
             self.add_widget(QLabel(arg)).add_widget(field)
 
+        self.attach_preview_button()
         self.attach_button()
         self.build()
 
-        self.attach_action(menu)
-
-    def accept(self):
+    def read_args(self) -> tuple:
         args = list()
         for field, f_type in zip(self.fields, self.types):
             args.append(f_type(field.text()))
+        return tuple(args)
+
+    def make_preview(self, args: tuple, full: bool) -> None:
+        self.backend.preview_filter(self.image_filter(*args), full)
 
+    def apply(self, args: tuple) -> None:
         self.backend.filter_image(self.image_filter(*args))
-        self.update_image_view()
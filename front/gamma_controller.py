@@ -1,7 +1,7 @@
 import typing as tp
 from abc import abstractmethod
 
-from PyQt6.QtWidgets import QMenu, QLineEdit, QLabel
+from PyQt6.QtWidgets import QLineEdit, QLabel
 
 from back import Backend
 from front.controller import Controller
@@ -9,7 +9,7 @@ from front.image_view import ImageView
 
 
 class GammaController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView):
         super().__init__(title, backend, image_view)
 
         self.gamma = QLineEdit()
@@ -17,7 +17,6 @@ class GammaController(Controller):
 
         self.attach_button()
         self.build()
-        self.attach_action(menu)
 
     def accept(self):
         try:
@@ -34,16 +33,16 @@ class GammaController(Controller):
 
 
 class StoreGammaController(GammaController):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView):
-        super().__init__(title, menu, backend, image_view)
+    def __init__(self, title: str, backend: Backend, image_view: ImageView):
+        super().__init__(title, backend, image_view)
 
     def do_gamma(self, gamma: float):
         self.backend.change_store_gamma(gamma)
 
 
 class DisplayGammaController(GammaController):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView):
-        super().__init__(title, menu, backend, image_view)
+    def __init__(self, title: str, backend: Backend, image_view: ImageView):
+        super().__init__(title, backend, image_view)
 
     def do_gamma(self, gamma: float):
         self.backend.change_display_gamma(gamma)
@@ -1,16 +1,15 @@
 import typing as tp
 from abc import abstractmethod
 
-from PyQt6.QtWidgets import QMenu, QLineEdit, QLabel
+from PyQt6.QtWidgets import QLineEdit, QLabel
 
 from back import Backend
-from back.utils import draw_gradient
 from front.controller import Controller
 from front.image_view import ImageView
 
 
 class GradientController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView):
         super().__init__(title, backend, image_view)
 
         self.width = QLineEdit()
@@ -21,7 +20,6 @@ class GradientController(Controller):
 
         self.attach_button()
         self.build()
-        self.attach_action(menu)
 
     def accept(self):
         try:
@@ -35,8 +33,4 @@ class GradientController(Controller):
         self.update_image_view()
 
     def draw_gradient(self, height: int, width: int):
-        gradient = draw_gradient(height, width)
-        self.backend.image_holder.set_image(gradient)
-        self.backend.store_gamma = 1.0
-        self.backend.display_gamma = 1.0
-        self.update_image_view()
+        self.backend.draw_gradient(height, width)
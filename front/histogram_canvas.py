@@ -0,0 +1,15 @@
+import matplotlib
+from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+
+matplotlib.use('QtAgg')
+
+
+class MplCanvas(FigureCanvasQTAgg):
+
+    def __init__(self, width=5, height=15, dpi=100):
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        self.red_axes = fig.add_subplot(311)
+        self.green_axes = fig.add_subplot(312)
+        self.blue_axes = fig.add_subplot(313)
+        super(MplCanvas, self).__init__(fig)
@@ -0,0 +1,40 @@
+from abc import abstractmethod
+
+from PyQt6.QtGui import QAction, QKeySequence
+from PyQt6.QtWidgets import QWidget
+
+from back import Backend
+from front.image_view import ImageView
+
+
+class HistoryController(QAction):
+    def __init__(self, title: str, parent: QWidget, backend: Backend, image_view: ImageView, shortcut: QKeySequence):
+        super().__init__(title, parent)
+        self.backend = backend
+        self.image_view = image_view
+        self.setShortcut(shortcut)
+        self.triggered.connect(self.accept)
+
+    def accept(self):
+        if self.step():
+            self.image_view.refresh()
+
+    @abstractmethod
+    def step(self) -> bool:
+        pass
+
+
+class UndoController(HistoryController):
+    def __init__(self, title: str, parent: QWidget, backend: Backend, image_view: ImageView):
+        super().__init__(title, parent, backend, image_view, QKeySequence(QKeySequence.StandardKey.Undo))
+
+    def step(self) -> bool:
+        return self.backend.undo()
+
+
+class RedoController(HistoryController):
+    def __init__(self, title: str, parent: QWidget, backend: Backend, image_view: ImageView):
+        super().__init__(title, parent, backend, image_view, QKeySequence(QKeySequence.StandardKey.Redo))
+
+    def step(self) -> bool:
+        return self.backend.redo()
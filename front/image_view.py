@@ -1,13 +1,87 @@
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtWidgets import QLabel
+import typing as tp
+from collections import OrderedDict
+
+import numpy as np
+import numpy.typing as npt
+from PyQt6.QtGui import QImage, QPainter, QPaintEvent, QWheelEvent
+from PyQt6.QtWidgets import QWidget
 from PyQt6.QtCore import Qt
 
+from back import Backend
+
+
+class DisplayTile:
+    # A persistent 8-bit RGB buffer with a QImage kept alive over the same memory,
+    # so rendering a tile writes straight into what is painted
+    def __init__(self, size: int):
+        self.buffer: npt.NDArray[np.uint8] = np.zeros((size, size, 3), dtype=np.uint8)
+        self.image: tp.Optional[QImage] = None
+
+    def wrap(self, height: int, width: int) -> npt.NDArray[np.uint8]:
+        size = self.buffer.shape[1]
+        self.image = QImage(self.buffer.data, width, height, size * 3, QImage.Format.Format_RGB888)
+        return self.buffer[:height, :width]
+
+
+class ImageView(QWidget):
+    TILE_SIZE = 256
+    CACHE_SIZE = 64
+    MIN_ZOOM = 1 / 32
+    MAX_ZOOM = 32.0
 
-class ImageView(QLabel):
-    def __init__(self):
+    def __init__(self, backend: Backend):
         super().__init__()
-        self.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.picture = QLabel("")
+        self.backend = backend
+        self.zoom = 1.0
+        self.tiles: tp.OrderedDict[tp.Tuple[int, int], DisplayTile] = OrderedDict()
+        self.free_tiles: tp.List[DisplayTile] = list()
+        self.refresh()
+
+    def refresh(self) -> None:
+        self.free_tiles.extend(self.tiles.values())
+        self.tiles.clear()
+        height, width = self.backend.get_size()
+        self.setFixedSize(max(1, round(width * self.zoom)), max(1, round(height * self.zoom)))
+        self.update()
+
+    def set_zoom(self, zoom: float) -> None:
+        self.zoom = min(max(zoom, self.MIN_ZOOM), self.MAX_ZOOM)
+        self.refresh()
+
+    def wheelEvent(self, event: QWheelEvent) -> None:
+        if not event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            return super().wheelEvent(event)
+        step = 1.25 if event.angleDelta().y() > 0 else 1 / 1.25
+        self.set_zoom(self.zoom * step)
+        event.accept()
+
+    def paintEvent(self, event: QPaintEvent) -> None:
+        rect = event.rect()
+        size = self.TILE_SIZE
+        painter = QPainter(self)
+        for row in range(rect.top() // size, rect.bottom() // size + 1):
+            for col in range(rect.left() // size, rect.right() // size + 1):
+                painter.drawImage(col * size, row * size, self.get_tile(row, col).image)
+        painter.end()
+
+    def get_tile(self, row: int, col: int) -> DisplayTile:
+        key = (row, col)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        if len(self.tiles) >= self.CACHE_SIZE:
+            _, tile = self.tiles.popitem(last=False)
+        elif self.free_tiles:
+            tile = self.free_tiles.pop()
+        else:
+            tile = DisplayTile(self.TILE_SIZE)
+        self.render_tile(row, col, tile)
+        self.tiles[key] = tile
+        return tile
 
-    def set_image(self, pixmap: QPixmap):
-        self.picture.setPixmap(pixmap)
+    def render_tile(self, row: int, col: int, tile: DisplayTile) -> None:
+        size = self.TILE_SIZE
+        top, left = row * size, col * size
+        height = min(size, self.height() - top)
+        width = min(size, self.width() - left)
+        self.backend.render((top, left, height, width), self.zoom, out=tile.wrap(height, width))
@@ -0,0 +1,85 @@
+import traceback
+import typing as tp
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from back.tasks import Task, CancelledError, run_task
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(float)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class Job(QRunnable):
+    def __init__(self, operation: tp.Callable[[], None]):
+        super().__init__()
+        self.operation = operation
+        self.signals = JobSignals()
+        self.task = Task(on_progress=self.signals.progress.emit)
+
+    def cancel(self) -> None:
+        self.task.cancel()
+
+    def run(self) -> None:
+        try:
+            with run_task(self.task):
+                self.task.report(0, 1)
+                self.operation()
+        except CancelledError:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit()
+
+
+class JobExecutor(QObject):
+    # Backend operations edit a single image, so they run one after another
+    # on a dedicated worker while the GUI thread stays free for browsing
+    started = pyqtSignal(str)
+    progress = pyqtSignal(float)
+    idle = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+        self.jobs: tp.List[Job] = list()
+
+    def submit(
+            self,
+            title: str,
+            operation: tp.Callable[[], None],
+            on_finished: tp.Optional[tp.Callable[[], None]] = None
+    ) -> Job:
+        job = Job(operation)
+        job.setAutoDelete(False)
+        job.signals.progress.connect(self.progress)
+        if on_finished is not None:
+            job.signals.finished.connect(on_finished)
+        job.signals.failed.connect(self.failed)
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(lambda *_, job=job: self._forget(job))
+        self.jobs.append(job)
+        self.started.emit(title)
+        self.pool.start(job)
+        return job
+
+    def cancel_all(self) -> None:
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self) -> None:
+        self.cancel_all()
+        self.pool.waitForDone()
+
+    def _forget(self, job: Job) -> None:
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if not self.jobs:
+            self.idle.emit()
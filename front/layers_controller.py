@@ -1,4 +1,4 @@
-from PyQt6.QtWidgets import QCheckBox, QMenu
+from PyQt6.QtWidgets import QCheckBox
 
 from back import Backend
 from front.controller import Controller
@@ -6,7 +6,7 @@ from front.image_view import ImageView
 
 
 class LayersController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView):
         super().__init__(title, backend, image_view)
 
         self.setMinimumSize(300, 75)
@@ -19,13 +19,11 @@ class LayersController(Controller):
         builder.build_layout().build()
         self.attach_button()
         self.build()
-        self.attach_action(menu)
 
     def accept(self):
         for i in range(3):
             self.backend.switch_layer(i, not self.channels[i].isChecked())
 
-        print(self.backend.turnoff_layers)
         self.update_image_view()
 
     def show(self):
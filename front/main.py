@@ -1,18 +1,24 @@
 import contextlib
 
 from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QMainWindow, QMessageBox, QScrollArea, QHBoxLayout, QVBoxLayout, QMenuBar, QWidget
+from PyQt6.QtWidgets import QMainWindow, QMessageBox, QScrollArea, QHBoxLayout, QVBoxLayout, QMenuBar, QWidget, \
+    QProgressBar, QPushButton, QStatusBar, QMenu
 
 from back import *
-from back.saving import P5Saver, P6Saver
+from back.saving import P5Saver, P6Saver, PNGSaver
 from back.scaling import *
 from .colorspace_controller import ColorSpaceController
 from .gamma_controller import StoreGammaController, DisplayGammaController
 
 from .image_view import ImageView
+from .job_executor import JobExecutor
 from .open_controller import OpenController
 from .layers_controller import LayersController
 from .save_controller import SaveController
+from .widget_controller import ActionController
+from .history_controller import UndoController, RedoController
+from .edit_stack_controller import EditStackController
+from .pipeline_controller import SavePipelineController, ApplyPipelineController
 
 # <-- LAB 5 -->
 from .gradient_controller import GradientController
@@ -34,8 +40,10 @@ class PhotoshopWindow(QMainWindow):
         super().__init__()
 
         self.backend = backend
-        self.image_view = ImageView()
+        self.image_view = ImageView(backend)
         self.error_box = PhotoshopWindow.setup_error_box(self)
+        self.executor = JobExecutor()
+        self.progress_bar, self.cancel_button = self.setup_status_bar()
         self.scroll = self.setup_scrolling()
         self.menu_bar = self.setup_menu_bar(self, backend)
         self.setup_window()
@@ -46,6 +54,10 @@ class PhotoshopWindow(QMainWindow):
         self.setGeometry(0, 0, 760, 780)
         self.setWindowTitle("Photoshop")
 
+    def closeEvent(self, event) -> None:
+        self.executor.shutdown()
+        super().closeEvent(event)
+
     def setup_central_layout(self):
         main_widget = QWidget()
         main_layout = QVBoxLayout(main_widget)
@@ -60,25 +72,52 @@ class PhotoshopWindow(QMainWindow):
     @contextlib.contextmanager
     def capture_exceptions(self) -> tp.Iterator[None]:
         try:
-            print(0)
-            try:
-                print(1)
-                yield
-            except Exception as e:
-                print(2)
-                self.error_box.setText(str(e))
-                self.error_box.exec()
-        finally:
-            pass
+            yield
+        except Exception as e:
+            self.error_box.setText(str(e))
+            self.error_box.exec()
 
     def setup_scrolling(self) -> QScrollArea:
         scroll = QScrollArea()
         scroll.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOn)
         scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOn)
-        scroll.setWidgetResizable(True)
-        scroll.setWidget(self.image_view.picture)
+        scroll.setWidgetResizable(False)
+        scroll.setWidget(self.image_view)
         return scroll
 
+    def setup_status_bar(self) -> tp.Tuple[QProgressBar, QPushButton]:
+        status_bar = QStatusBar()
+        progress_bar = QProgressBar()
+        progress_bar.setRange(0, 100)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(self.executor.cancel_all)
+        status_bar.addPermanentWidget(progress_bar)
+        status_bar.addPermanentWidget(cancel_button)
+        progress_bar.hide()
+        cancel_button.hide()
+        self.setStatusBar(status_bar)
+
+        self.executor.started.connect(self.on_job_started)
+        self.executor.progress.connect(lambda value: progress_bar.setValue(round(value * 100)))
+        self.executor.idle.connect(self.on_jobs_idle)
+        self.executor.failed.connect(self.show_error)
+        return progress_bar, cancel_button
+
+    def on_job_started(self, title: str) -> None:
+        self.statusBar().showMessage(title)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.cancel_button.show()
+
+    def on_jobs_idle(self) -> None:
+        self.statusBar().clearMessage()
+        self.progress_bar.hide()
+        self.cancel_button.hide()
+
+    def show_error(self, message: str) -> None:
+        self.error_box.setText(message)
+        self.error_box.exec()
+
     @staticmethod
     def setup_error_box(parent: QWidget) -> QMessageBox:
         error_box = QMessageBox(parent=parent)
@@ -88,12 +127,23 @@ class PhotoshopWindow(QMainWindow):
 
     def setup_menu_bar(self, parent: QMainWindow, backend: Backend) -> QMenuBar:
         menu_bar = QMenuBar()
-        writers = [P5Saver(), P6Saver()]
+        writers = [P5Saver(), P6Saver(), PNGSaver(1), PNGSaver(6), PNGSaver(9)]
 
         file_menu = menu_bar.addMenu("File")
         open_action = OpenController("Open", file_menu, backend, self.image_view)
         file_menu.addAction(open_action)
-        SaveController("Save", file_menu, self.backend, self.image_view, writers)
+        self.add_window(file_menu, "Save", lambda title: SaveController(title, self.backend, self.image_view, writers))
+
+        edit_menu = menu_bar.addMenu("Edit")
+        edit_menu.addAction(UndoController("Undo", edit_menu, backend, self.image_view))
+        edit_menu.addAction(RedoController("Redo", edit_menu, backend, self.image_view))
+        self.add_window(edit_menu, "Edit operations", lambda title: EditStackController(
+            title, self.backend, self.image_view, self.executor
+        ))
+        edit_menu.addAction(SavePipelineController("Save pipeline", edit_menu, backend, self.image_view))
+        edit_menu.addAction(ApplyPipelineController(
+            "Apply pipeline", edit_menu, backend, self.image_view, self.executor
+        ))
 
         converters: tp.List[ColorSpace] = [
             RGBSpace(),
@@ -106,10 +156,17 @@ class PhotoshopWindow(QMainWindow):
         ]
 
         settings_menu = menu_bar.addMenu("Settings")
-        ColorSpaceController("Change colorspace", settings_menu, self.backend, self.image_view, converters)
-        LayersController("Switch layer", settings_menu, self.backend, self.image_view)
-        StoreGammaController("Change Store Gamma", settings_menu, self.backend, self.image_view)
-        DisplayGammaController("Change Display Gamma", settings_menu, self.backend, self.image_view)
+        self.add_window(settings_menu, "Change colorspace", lambda title: ColorSpaceController(
+            title, self.backend, self.image_view, converters
+        ))
+        for title, controller in [
+            ("Switch layer", LayersController),
+            ("Change Store Gamma", StoreGammaController),
+            ("Change Display Gamma", DisplayGammaController)
+        ]:
+            self.add_window(settings_menu, title, lambda title, controller=controller: controller(
+                title, self.backend, self.image_view
+            ))
 
         # <-- LAB 5 -->
         ditherers: tp.List[ImageDitherer] = [
@@ -118,15 +175,23 @@ class PhotoshopWindow(QMainWindow):
             AtkinsonDitherer(),
             FloydSteinbergDitherer()
         ]
-        DitheringController("Dithering", settings_menu, self.backend, self.image_view, ditherers)
-        GradientController("Draw Gradient", file_menu, self.backend, self.image_view)
+        self.add_window(settings_menu, "Dithering", lambda title: DitheringController(
+            title, self.backend, self.image_view, ditherers, self.executor
+        ))
+        self.add_window(file_menu, "Draw Gradient", lambda title: GradientController(
+            title, self.backend, self.image_view
+        ))
 
         # <-- LAB 6 -->
-        AutocorrectionController("Autocorrection", settings_menu, self.backend, self.image_view)
+        self.add_window(settings_menu, "Autocorrection", lambda title: AutocorrectionController(
+            title, self.backend, self.image_view, self.executor
+        ))
 
         # <-- LAB 7 -->
         scalers: tp.List[OneDimensionScaler] = [NearestScaler(), LinearScaler(), SplineScaler(), LanczosScaler()]
-        ScaleController("Scale image", settings_menu, self.backend, self.image_view, scalers)
+        self.add_window(settings_menu, "Scale image", lambda title: ScaleController(
+            title, self.backend, self.image_view, scalers, self.executor
+        ))
 
         # <-- LAB 8 -->
         filter_menu = menu_bar.addMenu("Filters")
@@ -139,6 +204,13 @@ class PhotoshopWindow(QMainWindow):
             filtr.UnsharpMaskingFilter,
             filtr.OtsuThresholdFilter
             ]:
-            FilterController(image_filter.name(), filter_menu, self.backend, self.image_view, image_filter)
+            self.add_window(filter_menu, image_filter.name(), lambda title, image_filter=image_filter: FilterController(
+                title, self.backend, self.image_view, image_filter, self.executor
+            ))
 
         return menu_bar
+
+    @staticmethod
+    def add_window(menu: QMenu, title: str, factory: tp.Callable[[str], QWidget]) -> None:
+        # Controller windows are built on first use, keeping startup time independent of the number of tools
+        menu.addAction(ActionController(title, menu, lambda: factory(title)))
@@ -20,5 +20,4 @@ class OpenController(QAction):
             return
 
         self.backend.read_image(filename[0])
-        pixmap = self.backend.get_view()
-        self.image_view.set_image(pixmap)
+        self.image_view.refresh()
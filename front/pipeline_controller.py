@@ -0,0 +1,54 @@
+import os
+import typing as tp
+
+from PyQt6.QtGui import QAction
+from PyQt6.QtWidgets import QWidget, QFileDialog
+
+from back import Backend
+from front.image_view import ImageView
+from front.job_executor import JobExecutor
+
+
+class SavePipelineController(QAction):
+    def __init__(self, title: str, parent: QWidget, backend: Backend, image_view: ImageView):
+        super().__init__(title, parent)
+        self.backend = backend
+        self.image_view = image_view
+        self.triggered.connect(self.accept)
+
+    def accept(self):
+        filename = QFileDialog.getSaveFileName(self.parent(), 'Save pipeline', os.getcwd(), "Pipelines (*.json)")
+        if not os.path.exists(os.path.dirname(filename[0])):
+            return
+
+        self.backend.save_pipeline(filename[0])
+
+
+class ApplyPipelineController(QAction):
+    def __init__(
+            self,
+            title: str,
+            parent: QWidget,
+            backend: Backend,
+            image_view: ImageView,
+            executor: tp.Optional[JobExecutor] = None
+    ):
+        super().__init__(title, parent)
+        self.backend = backend
+        self.image_view = image_view
+        self.executor = executor
+        self.triggered.connect(self.accept)
+
+    def accept(self):
+        filename = QFileDialog.getOpenFileName(self.parent(), 'Apply pipeline', os.getcwd(), "Pipelines (*.json)")
+        if not os.path.isfile(filename[0]):
+            return
+
+        # the steps run in the background like any other operation, see Controller.run_operation
+        if self.executor is None:
+            self.backend.apply_pipeline(filename[0])
+            self.image_view.refresh()
+            return
+        self.executor.submit(
+            self.text(), lambda: self.backend.apply_pipeline(filename[0]), on_finished=self.image_view.refresh
+        )
@@ -0,0 +1,73 @@
+import typing as tp
+from abc import abstractmethod
+
+from PyQt6.QtGui import QHideEvent
+from PyQt6.QtWidgets import QPushButton
+
+from back import Backend
+from front.controller import Controller
+from front.image_view import ImageView
+from front.job_executor import JobExecutor, Job
+
+
+class PreviewController(Controller):
+    def __init__(self, title: str, backend: Backend, image_view: ImageView, executor: JobExecutor):
+        super().__init__(title, backend, image_view, executor)
+        self.preview_button = QPushButton("Preview")
+        self.preview_job: tp.Optional[Job] = None
+        self.previewed_args: tp.Optional[tuple] = None
+
+    @abstractmethod
+    def read_args(self) -> tuple:
+        pass
+
+    @abstractmethod
+    def make_preview(self, args: tuple, full: bool) -> None:
+        pass
+
+    @abstractmethod
+    def apply(self, args: tuple) -> None:
+        pass
+
+    def attach_preview_button(self) -> 'PreviewController':
+        self.add_widget(self.preview_button)
+        self.preview_button.clicked.connect(self.preview)
+
+        return self
+
+    def preview(self):
+        args = self.read_args()
+        self.cancel_preview()
+        self.make_preview(args, full=False)
+        self.update_image_view()
+
+        self.previewed_args = args
+        self.preview_job = self.executor.submit(
+            f"{self.title} preview",
+            lambda: self.make_preview(args, full=True),
+            on_finished=self.update_image_view
+        )
+
+    def accept(self):
+        args = self.read_args()
+        self.cancel_preview()
+        if args == self.previewed_args and self.backend.commit_preview():
+            self.previewed_args = None
+            self.update_image_view()
+            return
+        self.previewed_args = None
+        self.backend.clear_preview()
+        self.run_operation(lambda: self.apply(args))
+
+    def cancel_preview(self) -> None:
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+            self.preview_job = None
+
+    def hideEvent(self, event: QHideEvent) -> None:
+        self.cancel_preview()
+        if self.previewed_args is not None:
+            self.previewed_args = None
+            self.backend.clear_preview()
+            self.update_image_view()
+        super().hideEvent(event)
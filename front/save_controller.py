@@ -1,8 +1,7 @@
 import os
 import typing as tp
 
-import numpy as np
-from PyQt6.QtWidgets import QMenu, QComboBox, QFileDialog
+from PyQt6.QtWidgets import QComboBox, QFileDialog
 
 from back import Backend
 from back.saving import ImageSaver
@@ -11,7 +10,9 @@ from front.image_view import ImageView
 
 
 class SaveController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView, writers: tp.List[ImageSaver]):
+    BIT_DEPTHS = {"8 bit": 2 ** 8 - 1, "16 bit": 2 ** 16 - 1}
+
+    def __init__(self, title: str, backend: Backend, image_view: ImageView, writers: tp.List[ImageSaver]):
         super().__init__(title, backend, image_view)
         self.setMinimumSize(300, 100)
         self.writers = writers
@@ -20,9 +21,12 @@ class SaveController(Controller):
         for writer in self.writers:
             self.combobox.addItem(writer.name())
 
-        self.add_hor_layout().add_widget(self.combobox).build_layout()
+        self.depth_combobox = QComboBox()
+        for depth in self.BIT_DEPTHS:
+            self.depth_combobox.addItem(depth)
+
+        self.add_hor_layout().add_widget(self.combobox).add_widget(self.depth_combobox).build_layout()
         self.attach_button().build()
-        self.attach_action(menu)
 
     def accept(self):
         writer = self.writers[self.combobox.currentIndex()]
@@ -30,5 +34,6 @@ class SaveController(Controller):
         if not os.path.exists(os.path.dirname(filename)):
             return
 
-        writer.save((self.backend.image_holder.get_image() * 255).astype(np.uint8), open(filename, "wb"))
+        maxval = self.BIT_DEPTHS[self.depth_combobox.currentText()]
+        self.backend.save_image(writer, filename, maxval)
         self.hide()
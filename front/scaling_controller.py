@@ -1,16 +1,24 @@
 from typing import List
 
-from PyQt6.QtWidgets import QPushButton, QLineEdit, QLabel, QMenu, QComboBox
+from PyQt6.QtWidgets import QPushButton, QLineEdit, QLabel, QComboBox
 
 from back import Backend
 from back.scaling import OneDimensionScaler, Scaler
-from front.controller import Controller
+from front.preview_controller import PreviewController
 from front.image_view import ImageView
-
-
-class ScaleController(Controller):
-    def __init__(self, title: str, menu: QMenu, backend: Backend, image_view: ImageView, scalers: List[OneDimensionScaler]):
-        super().__init__(title, backend, image_view)
+from front.job_executor import JobExecutor
+
+
+class ScaleController(PreviewController):
+    def __init__(
+            self,
+            title: str,
+            backend: Backend,
+            image_view: ImageView,
+            scalers: List[OneDimensionScaler],
+            executor: JobExecutor
+    ):
+        super().__init__(title, backend, image_view, executor)
         self.button = QPushButton("Ok")
 
         self.width = QLineEdit()
@@ -31,19 +39,25 @@ class ScaleController(Controller):
         self.add_widget(QLabel("B")).add_widget(self.b)
         self.add_widget(QLabel("C")).add_widget(self.c)
 
+        self.attach_preview_button()
         self.attach_button()
         self.build()
 
-        self.attach_action(menu)
-
-    def accept(self):
-        scaler = self.scalers[self.scaler.currentIndex()]
-        width = int(self.width.text())
-        height = int(self.height.text())
-        h_offset = int(self.h_offset.text())
-        w_offset = int(self.w_offset.text())
-        b = float(self.b.text())
-        c = float(self.c.text())
-
-        self.backend.scale_image(scaler, height, width, h_offset, w_offset, b=b, c=c)
-        self.update_image_view()
+    def read_args(self) -> tuple:
+        return (
+            self.scaler.currentIndex(),
+            int(self.height.text()),
+            int(self.width.text()),
+            int(self.h_offset.text()),
+            int(self.w_offset.text()),
+            float(self.b.text()),
+            float(self.c.text())
+        )
+
+    def make_preview(self, args: tuple, full: bool) -> None:
+        index, height, width, h_offset, w_offset, b, c = args
+        self.backend.preview_scale(self.scalers[index], height, width, h_offset, w_offset, full=full, b=b, c=c)
+
+    def apply(self, args: tuple) -> None:
+        index, height, width, h_offset, w_offset, b, c = args
+        self.backend.scale_image(self.scalers[index], height, width, h_offset, w_offset, b=b, c=c)
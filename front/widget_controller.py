@@ -1,7 +1,8 @@
+import typing as tp
 from abc import ABC, abstractmethod
 
 from PyQt6.QtGui import QAction
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QBoxLayout, QMenu
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QBoxLayout
 
 
 class ControllerBuilder(ABC):
@@ -39,10 +40,17 @@ class LayoutBuilder(ControllerBuilder):
 
 
 class ActionController(QAction):
-    def __init__(self, title: str, parent: QWidget, window: QWidget):
+    # The window is only built, with whatever it imports, the first time the action is triggered
+    def __init__(self, title: str, parent: QWidget, factory: tp.Callable[[], QWidget]):
         super().__init__(title, parent)
-        self.window = window
-        self.triggered.connect(self.window.show)
+        self.factory = factory
+        self.window: tp.Optional[QWidget] = None
+        self.triggered.connect(self.show_window)
+
+    def show_window(self) -> None:
+        if self.window is None:
+            self.window = self.factory()
+        self.window.show()
 
 
 class WidgetController(QWidget):
@@ -63,12 +71,6 @@ class WidgetController(QWidget):
     def add_ver_layout(self) -> LayoutBuilder:
         return LayoutBuilder(self, "ver")
 
-    def attach_action(self, parent: QMenu):
-        action = ActionController(self.title, parent, self)
-        parent.addAction(action)
-
-        return self
-
     def build(self):
         self.setLayout(self.__central_layout)
 